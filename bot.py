@@ -1,19 +1,128 @@
 # --- Импорты стандартных и сторонних библиотек ---
 import asyncio
 import logging
+import signal
+from contextlib import suppress
+from typing import Any, Dict, Optional, Set
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # --- Импорты собственных модулей ---
-from config import BOT_TOKEN, ADMIN_IDS
-from database import init_db, close_db
+from config import (
+    BOT_TOKEN, ADMIN_IDS, RUN_MODE,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+)
+from database import init_db, close_db, async_session, get_pool_stats, get_cache_stats, get_reference_data
+from fsm_storage import create_storage, create_events_isolation, DatabaseStorage
+from middlewares import DbSessionMiddleware, ClientMiddleware
+from services.broadcast import broadcast_service
 from utils import setup_logging
 
 # --- Импорт роутеров ---
 from handlers import registration, catalog, cart, orders, profile, admin
 
+# Сколько секунд ждать завершения начатых обработчиков при остановке вебхука
+SHUTDOWN_TIMEOUT = 30
+
+
+# --- Режим вебхука ---
+async def health_check(request: web.Request) -> web.Response:
+    """Проверка работоспособности воркера для балансировщика"""
+    return web.json_response({"status": "ok", "pool": get_pool_stats(), "caches": get_cache_stats()})
+
+
+class WebhookRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, который сам учитывает обработку принятых обновлений.
+
+    Telegram получает ответ сразу, обновление обрабатывается в фоновой задаче;
+    задачи хранятся в pending, чтобы при остановке дождаться их завершения.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, secret_token=secret_token)
+        self.pending: Set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(self.feed_update(bot, update))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def feed_update(self, bot: Bot, update: Dict[str, Any]):
+        """Передать обновление диспетчеру и выполнить метод, возвращенный обработчиком"""
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def wait_pending(self, timeout: float):
+        """Дождаться обработки уже принятых обновлений"""
+        pending = [task for task in self.pending if not task.done()]
+        if pending:
+            logging.getLogger(__name__).info(f"Ожидание завершения обработчиков: {len(pending)}")
+            await asyncio.wait(pending, timeout=timeout)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запуск aiohttp-сервера, принимающего обновления от Telegram"""
+    logger = logging.getLogger(__name__)
+
+    app = web.Application()
+    app.router.add_get("/health", health_check)
+
+    # Проверка заголовка X-Telegram-Bot-Api-Secret-Token
+    webhook_handler = WebhookRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None
+    )
+
+    async def stop_workers(_: web.Application):
+        """Остановить рассылку и дождаться принятых обновлений, пока сессия бота открыта"""
+        await broadcast_service.stop()
+        await webhook_handler.wait_pending(SHUTDOWN_TIMEOUT)
+
+    # aiohttp вызывает on_shutdown в порядке регистрации: register() добавляет
+    # закрытие сессии бота, setup_application() - emit_shutdown диспетчера
+    # (закрытие хранилища FSM). Поэтому остановка воркеров регистрируется первой
+    app.on_shutdown.append(stop_workers)
+    webhook_handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    # Вебхук не удаляется при остановке: остальные воркеры продолжают принимать обновления
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+    logger.info(f"Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    # --- Ожидание сигнала остановки ---
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):  # На Windows обработчики сигналов недоступны
+            loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Остановка веб-сервера...")
+        await runner.cleanup()
+
 
 # --- Основная функция ---
 async def main():
@@ -30,8 +139,13 @@ async def main():
     )
     await bot.set_my_commands([])  # Удаление бокового меню
 
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    # Хранилище FSM закрывается диспетчером при остановке
+    storage = create_storage()
+    dp = Dispatcher(storage=storage, events_isolation=create_events_isolation(storage))
+
+    # --- Регистрация middleware ---
+    dp.update.outer_middleware(DbSessionMiddleware(async_session))
+    dp.update.outer_middleware(ClientMiddleware())
 
     # --- Регистрация роутеров ---
     dp.include_router(registration.router)
@@ -41,12 +155,30 @@ async def main():
     dp.include_router(profile.router)
     dp.include_router(admin.router)
 
+    # Воркер рассылок: подхватывает незавершенные задания после перезапуска.
+    # В режиме вебхука он останавливается раньше, в run_webhook; повторный
+    # stop() ничего не делает
+    dp.startup.register(broadcast_service.start)
+    dp.shutdown.register(broadcast_service.stop)
+
     try:
         # --- Инициализация базы данных ---
         logger.info("Инициализация базы данных...")
         await init_db()
         logger.info("База данных инициализирована успешно")
 
+        # --- Загрузка справочников в кэш ---
+        reference_data = await get_reference_data()
+        logger.info(
+            f"Справочники загружены: стран {len(reference_data.countries)}, "
+            f"магазинов {len(reference_data.shops)}, категорий {len(reference_data.categories)}"
+        )
+
+        # --- Очистка устаревших состояний FSM ---
+        if isinstance(storage, DatabaseStorage):
+            removed = await storage.delete_expired()
+            logger.info(f"Удалено устаревших состояний FSM: {removed}")
+
         # --- Уведомление администраторов ---
         for admin_id in ADMIN_IDS:
             try:
@@ -59,8 +191,14 @@ async def main():
 
         logger.info("Бот запущен и готов к работе!")
 
-        # --- Запуск поллинга ---
-        await dp.start_polling(bot)
+        if RUN_MODE == "webhook":
+            # --- Запуск веб-сервера ---
+            await run_webhook(bot, dp)
+        else:
+            # --- Запуск поллинга ---
+            # getUpdates не работает, пока у бота установлен вебхук
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
 
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
@@ -0,0 +1,223 @@
+# --- Импорты ---
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Type, TypeVar
+
+
+# --- Кэш курсов валют ---
+class ExchangeRatesCache:
+    """Курсы валют к рублю в памяти процесса с ограниченным временем жизни"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._rates: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+
+    def get(self) -> Optional[Dict[str, float]]:
+        """Вернуть копию курсов или None, если кэш пуст или устарел"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            return None
+        return dict(self._rates)
+
+    def set(self, rates: Dict[str, float]) -> None:
+        """Заменить все курсы разом (после загрузки из БД)"""
+        self._rates = dict(rates)
+        self._loaded_at = time.monotonic()
+
+    def update(self, currency: str, rate_to_rub: float) -> None:
+        """Обновить один курс, если кэш уже загружен"""
+        if self._loaded_at is not None:
+            self._rates[currency] = rate_to_rub
+
+    def invalidate(self) -> None:
+        """Сбросить кэш: следующее чтение загрузит курсы из БД"""
+        self._rates = {}
+        self._loaded_at = None
+
+
+# --- Снимки записей для кэшей ---
+# Кэши хранят неизменяемые копии столбцов, а не ORM-объекты: объект из кэша
+# используется параллельными апдейтами, и его нельзя изменить или привязать к сессии.
+SnapshotT = TypeVar('SnapshotT')
+
+
+def snapshot(cls: Type[SnapshotT], obj, **extra) -> SnapshotT:
+    """Копия полей cls из ORM-объекта obj; поля из extra берутся как есть"""
+    values = {field.name: getattr(obj, field.name) for field in fields(cls) if field.name not in extra}
+    return cls(**values, **extra)
+
+
+@dataclass(frozen=True)
+class CountrySnapshot:
+    id: int
+    name: str
+    currency: str
+    flag_emoji: str
+    delivery_base_cost: int
+
+
+@dataclass(frozen=True)
+class ShopSnapshot:
+    id: int
+    country_id: int
+    name: str
+    description: Optional[str]
+    website: Optional[str]
+    country_name: str  # Поля страны магазина (shop.country)
+    country_flag_emoji: str
+
+
+@dataclass(frozen=True)
+class CategorySnapshot:
+    id: int
+    name: str
+    description: Optional[str]
+
+
+@dataclass(frozen=True)
+class ProductSnapshot:
+    id: int
+    shop_id: int
+    category_id: int
+    name: str
+    description: Optional[str]
+    price_original: float
+    currency: str
+    weight: Optional[float]
+    photo_url: Optional[str]
+    photo_file_id: Optional[str]
+
+
+@dataclass(frozen=True)
+class ClientSnapshot:
+    id: int
+    telegram_id: int
+    name: str
+    phone: str
+    address: Optional[str]
+    registration_date: Optional[datetime]
+
+
+# --- Кэш справочников ---
+class ReferenceData:
+    """Снимок справочников: страны, магазины (с полями страны) и категории"""
+
+    def __init__(
+        self,
+        countries: List[CountrySnapshot],
+        shops: List[ShopSnapshot],
+        categories: List[CategorySnapshot]
+    ):
+        self.countries = list(countries)
+        self.shops = list(shops)
+        self.categories = list(categories)
+        self.countries_by_id = {country.id: country for country in self.countries}
+        self.shops_by_id = {shop.id: shop for shop in self.shops}
+        self.categories_by_id = {category.id: category for category in self.categories}
+        self.shops_by_country: Dict[int, List[ShopSnapshot]] = {}
+        for shop in self.shops:
+            self.shops_by_country.setdefault(shop.country_id, []).append(shop)
+
+
+class ReferenceDataCache:
+    """Снимок справочников в памяти процесса с ограниченным временем жизни.
+
+    Сброс во время загрузки из БД отменяет сохранение этой загрузки, чтобы
+    в кэш не попал снимок, прочитанный до изменения.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Optional[ReferenceData] = None
+        self._loaded_at: Optional[float] = None
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Номер поколения кэша, увеличивается при каждом сбросе"""
+        return self._version
+
+    def get(self) -> Optional[ReferenceData]:
+        """Вернуть снимок или None, если кэш пуст или устарел"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            return None
+        return self._data
+
+    def set(self, data: ReferenceData, version: int) -> None:
+        """Сохранить снимок, загруженный при поколении version"""
+        if version != self._version:
+            return
+        self._data = data
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Сбросить кэш: следующее чтение загрузит справочники из БД"""
+        self._data = None
+        self._loaded_at = None
+        self._version += 1
+
+
+# --- LRU-кэш с ограниченным временем жизни ---
+class LRUCache:
+    """Не более maxsize записей, вытесняются давно не использованные.
+
+    Запись живет ttl секунд. Счетчики hits/misses показывают эффективность
+    кэша. Как и в ReferenceDataCache, сброс записи во время её загрузки из БД
+    отменяет сохранение этой загрузки.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Номер поколения кэша, увеличивается при каждом сбросе"""
+        return self._version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Вернуть значение или None, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, version: int) -> None:
+        """Сохранить значение, загруженное при поколении version"""
+        if version != self._version or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Сбросить одну запись"""
+        self._entries.pop(key, None)
+        self._version += 1
+
+    def clear(self) -> None:
+        """Сбросить все записи"""
+        self._entries.clear()
+        self._version += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Размер кэша и счетчики попаданий"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0
+        }
@@ -57,6 +57,58 @@ if not DATABASE_URL:
 else:
     print(f"ℹ️  Используется база данных из DATABASE_URL: {DATABASE_URL.split('://')[0]}")
 
+# --- Настройки пула соединений ---
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))  # Постоянные соединения
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))  # Дополнительные соединения при пиках
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # Ожидание свободного соединения, сек
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # Пересоздание соединений старше N сек
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))  # Таймаут запроса, мс (0 - без ограничения)
+
+# --- Хранилище состояний FSM ---
+# memory    - в памяти процесса (по умолчанию, теряется при перезапуске, без TTL)
+# redis     - Redis по REDIS_URL (несколько воркеров, переживает перезапуск)
+# fakeredis - встроенная замена Redis для тестов (нужен пакет fakeredis)
+# database  - таблица fsm_states в основной базе данных
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory').lower()
+if FSM_STORAGE not in ('memory', 'redis', 'fakeredis', 'database'):
+    raise ValueError("❌ Неверный FSM_STORAGE! Допустимо: memory, redis, fakeredis, database.")
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', '86400'))  # Срок жизни неактивного состояния, сек (0 - бессрочно)
+FSM_LOCK_POOL_SIZE = int(os.getenv('FSM_LOCK_POOL_SIZE', '10'))  # Соединения для блокировок FSM_STORAGE=database
+
+# --- Режим получения обновлений ---
+# polling - long polling (по умолчанию, удобно для разработки)
+# webhook - aiohttp-сервер, Telegram сам присылает обновления (можно держать несколько воркеров за балансировщиком)
+RUN_MODE = os.getenv('RUN_MODE', 'polling').lower()
+if RUN_MODE not in ('polling', 'webhook'):
+    raise ValueError("❌ Неверный RUN_MODE! Допустимо: polling, webhook.")
+
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/')  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+
+if RUN_MODE == 'webhook':
+    if not WEBHOOK_BASE_URL:
+        raise ValueError("❌ WEBHOOK_BASE_URL не указан! Он обязателен в режиме webhook.")
+    if not WEBHOOK_PATH.startswith('/'):
+        WEBHOOK_PATH = f"/{WEBHOOK_PATH}"
+    if not WEBHOOK_SECRET:
+        print("⚠️  WEBHOOK_SECRET не указан. Запросы к вебхуку не будут проверяться.")
+
+# --- Настройки рассылки ---
+# Telegram допускает около 30 сообщений в секунду на бота и 1 сообщение в секунду в один чат
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))  # Сообщений в секунду
+BROADCAST_CHAT_INTERVAL = float(os.getenv('BROADCAST_CHAT_INTERVAL', '1'))  # Интервал между сообщениями в один чат, сек
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))  # Одновременных запросов к Telegram
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))  # Обновление прогресса, сек
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))  # Получателей между контрольными точками
+BROADCAST_JOB_LEASE = int(os.getenv('BROADCAST_JOB_LEASE', '120'))  # Через сколько секунд без отметок задание считается брошенным
+BROADCAST_POLL_INTERVAL = float(os.getenv('BROADCAST_POLL_INTERVAL', '30'))  # Проверка очереди заданий, сек
+
 # --- Настройки логирования ---
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
@@ -70,6 +122,18 @@ DELIVERY_TYPES = {
 # --- Таможенный сбор (процент от суммы заказа) ---
 CUSTOMS_FEE_PERCENT = 0.15  # 15%
 
+# --- Настройки кэширования ---
+# Время жизни кэша курсов валют в секундах
+EXCHANGE_RATES_CACHE_TTL = int(os.getenv('EXCHANGE_RATES_CACHE_TTL', '300'))
+# Время жизни кэша справочников (страны, магазины, категории) в секундах
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', '600'))
+# Кэш карточек товаров: максимальное число товаров и время жизни записи в секундах
+PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', '1000'))
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', '300'))
+# Кэш клиентов по telegram_id: максимальное число клиентов и время жизни записи в секундах
+CLIENT_CACHE_SIZE = int(os.getenv('CLIENT_CACHE_SIZE', '10000'))
+CLIENT_CACHE_TTL = int(os.getenv('CLIENT_CACHE_TTL', '600'))
+
 
 # --- Информация о конфигурации ---
 def print_config_info():
@@ -79,6 +143,9 @@ def print_config_info():
     print(f"👑 Админы: {len(ADMIN_IDS)} пользователей")
     print(f"🗺️  Dadata: {'✅ Включен' if DADATA_TOKEN and DADATA_SECRET else '❌ Выключен'}")
     print(f"🗄️  База данных: {DATABASE_URL.split('://')[0]}")
+    print(f"💾 Хранилище FSM: {FSM_STORAGE}")
+    print(f"📡 Режим: {RUN_MODE}" + (f" ({WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH})" if RUN_MODE == 'webhook' else ""))
+    print(f"🔌 Пул соединений: {DB_POOL_SIZE} + {DB_MAX_OVERFLOW} (pre-ping: {'да' if DB_POOL_PRE_PING else 'нет'})")
     print("========================\n")
 
 
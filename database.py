@@ -1,23 +1,150 @@
 # --- Импорты ---
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict, Tuple, AsyncIterator, Callable, Sequence
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import asyncio
 import random
 import string
+import time
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import select, delete, update, func
+from sqlalchemy import select, delete, update, func, insert, or_, and_, event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, TimeoutError as SQLAlchemyTimeoutError
+from sqlalchemy.orm import joinedload, contains_eager
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from models import (
     Base, Client, Country, Shop, Category, Product, Order, OrderItem,
-    ExchangeRate, Admin, CartItem
+    ExchangeRate, Admin, CartItem, BroadcastJob, BroadcastDelivery
 )
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, EXCHANGE_RATES_CACHE_TTL, REFERENCE_CACHE_TTL,
+    PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, CLIENT_CACHE_SIZE, CLIENT_CACHE_TTL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT
+)
+from cache import (
+    ExchangeRatesCache, ReferenceData, ReferenceDataCache, LRUCache, snapshot,
+    ClientSnapshot, ProductSnapshot, CountrySnapshot, ShopSnapshot, CategorySnapshot
+)
+from utils import snapshot_cart_items, calculate_order_totals
+
+
+# --- Метрики пула соединений ---
+class PoolMetrics:
+    """Счетчики получения соединений из пула.
+
+    Ожидание свободного соединения и открытие нового соединения с БД
+    учитываются отдельно.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connects = 0
+        self.connect_errors = 0
+        self.connect_total = 0.0
+        self.connect_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def record_connect(self, seconds: float) -> None:
+        self.connects += 1
+        self.connect_total += seconds
+        self.connect_max = max(self.connect_max, seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+            'connects': self.connects,
+            'connect_errors': self.connect_errors,
+            'connect_avg_ms': self.connect_total / self.connects * 1000 if self.connects else 0.0,
+            'connect_max_ms': self.connect_max * 1000
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий ожидание соединения и время подключения к БД"""
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        try:
+            record = super()._create_connection()
+        except Exception:
+            pool_metrics.connect_errors += 1
+            raise
+        # Время подключения вычитается из ожидания при выдаче этого соединения
+        record.connect_seconds = time.perf_counter() - started
+        pool_metrics.record_connect(record.connect_seconds)
+        return record
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except SQLAlchemyTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        elapsed = time.perf_counter() - started
+        connect_seconds = record.__dict__.pop('connect_seconds', 0.0)
+        pool_metrics.record_wait(max(elapsed - connect_seconds, 0.0))
+        return record
+
+
+def _engine_options() -> dict:
+    """Параметры движка и пула соединений из config.py"""
+    options = {
+        'echo': False,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE
+    }
+    # SQLite (локальная разработка) работает со своим пулом без ограничений размера
+    if DATABASE_URL.startswith('sqlite'):
+        return options
+
+    options.update(
+        poolclass=MonitoredQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+    if DB_STATEMENT_TIMEOUT and '+asyncpg' in DATABASE_URL:
+        options['connect_args'] = {
+            'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT)}
+        }
+    return options
 
 
 # --- Подключение к базе данных ---
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_async_engine(DATABASE_URL, **_engine_options())
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# --- Кэш курсов валют ---
+rates_cache = ExchangeRatesCache(ttl=EXCHANGE_RATES_CACHE_TTL)
+_rates_lock = asyncio.Lock()
+
+# --- Кэш справочников ---
+reference_cache = ReferenceDataCache(ttl=REFERENCE_CACHE_TTL)
+
+# --- Кэш карточек товаров ---
+product_cache = LRUCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+
+# --- Кэш клиентов по telegram_id ---
+client_cache = LRUCache(maxsize=CLIENT_CACHE_SIZE, ttl=CLIENT_CACHE_TTL)
+
 
 # --- Инициализация базы данных ---
 async def init_db():
@@ -25,65 +152,206 @@ async def init_db():
         await conn.run_sync(Base.metadata.create_all)
 
 
+# --- Сессии ---
+@asynccontextmanager
+async def session_scope(
+    session: Optional[AsyncSession] = None,
+    commit: bool = False
+) -> AsyncIterator[AsyncSession]:
+    """Сессия апдейта из middleware или собственная короткая сессия.
+
+    Чужую сессию функции только flush-ят: транзакцию фиксирует тот, кто её открыл
+    (DbSessionMiddleware в конце обработки апдейта). Собственная сессия
+    коммитится здесь, если функция что-то изменяет.
+    """
+    if session is not None:
+        yield session
+        if commit:
+            await session.flush()
+        return
+
+    async with async_session() as own_session:
+        yield own_session
+        if commit:
+            await own_session.commit()
+
+
 # --- Утилиты ---
 async def get_one(session: AsyncSession, stmt) -> Optional[object]:
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
 
+def upsert(model):
+    """INSERT с поддержкой ON CONFLICT для текущей СУБД (PostgreSQL или SQLite)"""
+    if engine.dialect.name == 'postgresql':
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def keyset_condition(columns: Sequence, values: Sequence, newer: bool):
+    """Условие «строка новее/старше курсора» по столбцам columns (лексикографически)"""
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        compare = column > value if newer else column < value
+        conditions.append(and_(*(c == v for c, v in zip(columns[:i], values[:i])), compare))
+    return or_(*conditions)
+
+
+async def get_keyset_page(
+    stmt,
+    columns: Sequence,
+    limit: int,
+    after: Optional[Sequence] = None,
+    before: Optional[Sequence] = None,
+    scalars: bool = True,
+    session: Optional[AsyncSession] = None
+) -> Tuple[list, bool]:
+    """Страница stmt (новые сверху) с keyset-пагинацией по столбцам columns.
+
+    after - курсор следующей страницы (значения columns последней строки
+    текущей), before - курсор предыдущей (первой строки). Второй элемент
+    результата - есть ли еще строки в направлении листания. scalars=False
+    возвращает строки целиком, а не первый столбец.
+    """
+    if before is not None:
+        stmt = stmt.where(keyset_condition(columns, before, newer=True))
+        stmt = stmt.order_by(*(column.asc() for column in columns))
+    else:
+        if after is not None:
+            stmt = stmt.where(keyset_condition(columns, after, newer=False))
+        stmt = stmt.order_by(*(column.desc() for column in columns))
+
+    async with session_scope(session) as session:
+        # Лишняя строка показывает, есть ли следующая страница, без COUNT
+        result = await session.execute(stmt.limit(limit + 1))
+        rows = list(result.scalars().all() if scalars else result.all())
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+def on_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """Выполнить callback после фиксации текущей транзакции session.
+
+    Если транзакция откатится, callback не выполняется и при следующих коммитах
+    этой сессии. Точки сохранения (begin_nested) на это не влияют.
+    """
+    state = {'active': True}
+
+    def after_commit(_):
+        if state['active']:
+            state['active'] = False
+            callback()
+
+    def after_transaction_end(_, transaction):
+        if transaction.parent is None:
+            state['active'] = False
+
+    event.listen(session.sync_session, 'after_commit', after_commit)
+    event.listen(session.sync_session, 'after_transaction_end', after_transaction_end)
+
+
+def invalidate_on_commit(session: AsyncSession, invalidate: Callable[[], None]) -> None:
+    """Сбросить кэш сейчас и еще раз после фиксации транзакции session.
+
+    Повторный сброс убирает значение, которое параллельный апдейт успел
+    прочитать из БД до фиксации изменения.
+    """
+    invalidate()
+    on_commit(session, invalidate)
+
+
+def cache_after_commit(session: AsyncSession, fill: Callable[[], None]) -> None:
+    """Положить в кэш данные, прочитанные в session, после фиксации её транзакции.
+
+    Так в кэш не попадают изменения, которые потом откатятся. Собственная
+    короткая сессия session_scope к этому моменту уже закрыта - кэш
+    заполняется сразу.
+    """
+    if session.in_transaction():
+        on_commit(session, fill)
+    else:
+        fill()
+
+
 def generate_tracking_number() -> str:
     """Генерация уникального номера отслеживания"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
 
 
 # --- Методы: Клиенты ---
-async def get_client_by_telegram_id(telegram_id: int) -> Optional[Client]:
-    async with async_session() as session:
-        return await get_one(session, select(Client).where(Client.telegram_id == telegram_id))
+async def get_client_by_telegram_id(
+    telegram_id: int,
+    session: Optional[AsyncSession] = None
+) -> Optional[ClientSnapshot]:
+    """Снимок клиента из кэша клиентов или из БД.
+
+    Как и в get_product_by_id, возвращается неизменяемый снимок, а в кэш он
+    попадает после фиксации транзакции session. Незарегистрированные
+    пользователи не кэшируются.
+    """
+    client = client_cache.get(telegram_id)
+    if client is not None:
+        return client
 
+    version = client_cache.version
+    async with session_scope(session) as session:
+        client = await get_one(session, select(Client).where(Client.telegram_id == telegram_id))
+    if client is None:
+        return None
 
-async def get_client_by_id(client_id: int) -> Optional[Client]:
-    async with async_session() as session:
-        return await get_one(session, select(Client).where(Client.id == client_id))
+    client = snapshot(ClientSnapshot, client)
+    cache_after_commit(session, lambda: client_cache.set(telegram_id, client, version))
+    return client
 
 
-async def create_client(telegram_id: int, name: str, phone: str, address: str = None) -> Client:
-    async with async_session() as session:
+async def create_client(
+    telegram_id: int,
+    name: str,
+    phone: str,
+    address: str = None,
+    session: Optional[AsyncSession] = None
+) -> Client:
+    async with session_scope(session, commit=True) as session:
         client = Client(telegram_id=telegram_id, name=name, phone=phone, address=address)
         session.add(client)
-        await session.commit()
-        await session.refresh(client)
-        return client
-
+        await session.flush()
 
-async def update_client_address(client_id: int, address: str) -> None:
-    async with async_session() as session:
-        await session.execute(
-            update(Client).where(Client.id == client_id).values(address=address)
-        )
-        await session.commit()
+        # В кэш клиент попадает только после фиксации регистрации
+        version = client_cache.version
+        cached = snapshot(ClientSnapshot, client)
+        on_commit(session, lambda: client_cache.set(telegram_id, cached, version))
+        return client
 
 
-async def get_all_clients() -> List[Client]:
-    async with async_session() as session:
-        result = await session.execute(select(Client))
-        return result.scalars().all()
+async def count_clients(session: Optional[AsyncSession] = None) -> int:
+    async with session_scope(session) as session:
+        return await session.scalar(select(func.count(Client.id)))
 
 
 # --- Методы: Страны ---
-async def get_all_countries() -> List[Country]:
-    async with async_session() as session:
-        result = await session.execute(select(Country))
-        return result.scalars().all()
+async def get_all_countries(session: Optional[AsyncSession] = None) -> List[CountrySnapshot]:
+    """Все страны из кэша справочников """
+    return list((await get_reference_data(session)).countries)
 
 
-async def get_country_by_id(country_id: int) -> Optional[Country]:
-    async with async_session() as session:
-        return await get_one(session, select(Country).where(Country.id == country_id))
+async def get_country_by_id(country_id: int, session: Optional[AsyncSession] = None) -> Optional[CountrySnapshot]:
+    """Страна из кэша справочников """
+    return (await get_reference_data(session)).countries_by_id.get(country_id)
 
 
-async def add_country(name: str, currency: str, flag_emoji: str, delivery_base_cost: int) -> Country:
-    async with async_session() as session:
+async def add_country(
+    name: str,
+    currency: str,
+    flag_emoji: str,
+    delivery_base_cost: int,
+    session: Optional[AsyncSession] = None
+) -> Country:
+    async with session_scope(session, commit=True) as session:
         country = Country(
             name=name,
             currency=currency,
@@ -91,25 +359,31 @@ async def add_country(name: str, currency: str, flag_emoji: str, delivery_base_c
             delivery_base_cost=delivery_base_cost
         )
         session.add(country)
-        await session.commit()
-        await session.refresh(country)
+        await session.flush()
+        session.info.pop('reference_data', None)
+        invalidate_on_commit(session, reference_cache.invalidate)
         return country
 
 
 # --- Методы: Магазины ---
-async def get_shops_by_country(country_id: int) -> List[Shop]:
-    async with async_session() as session:
-        result = await session.execute(select(Shop).where(Shop.country_id == country_id))
-        return result.scalars().all()
+async def get_shops_by_country(country_id: int, session: Optional[AsyncSession] = None) -> List[ShopSnapshot]:
+    """Магазины страны из кэша справочников """
+    return list((await get_reference_data(session)).shops_by_country.get(country_id, []))
 
 
-async def get_shop_by_id(shop_id: int) -> Optional[Shop]:
-    async with async_session() as session:
-        return await get_one(session, select(Shop).where(Shop.id == shop_id))
+async def get_shop_by_id(shop_id: int, session: Optional[AsyncSession] = None) -> Optional[ShopSnapshot]:
+    """Магазин из кэша справочников """
+    return (await get_reference_data(session)).shops_by_id.get(shop_id)
 
 
-async def add_shop(country_id: int, name: str, description: str = None, website: str = None) -> Shop:
-    async with async_session() as session:
+async def add_shop(
+    country_id: int,
+    name: str,
+    description: str = None,
+    website: str = None,
+    session: Optional[AsyncSession] = None
+) -> Shop:
+    async with session_scope(session, commit=True) as session:
         shop = Shop(
             country_id=country_id,
             name=name,
@@ -117,48 +391,115 @@ async def add_shop(country_id: int, name: str, description: str = None, website:
             website=website
         )
         session.add(shop)
-        await session.commit()
-        await session.refresh(shop)
+        await session.flush()
+        session.info.pop('reference_data', None)
+        invalidate_on_commit(session, reference_cache.invalidate)
         return shop
 
 
 # --- Методы: Категории ---
-async def get_all_categories() -> List[Category]:
-    async with async_session() as session:
-        result = await session.execute(select(Category))
-        return result.scalars().all()
+async def get_all_categories(session: Optional[AsyncSession] = None) -> List[CategorySnapshot]:
+    """Все категории из кэша справочников """
+    return list((await get_reference_data(session)).categories)
 
 
-async def get_category_by_id(category_id: int) -> Optional[Category]:
-    async with async_session() as session:
-        return await get_one(session, select(Category).where(Category.id == category_id))
+async def get_category_by_id(category_id: int, session: Optional[AsyncSession] = None) -> Optional[CategorySnapshot]:
+    """Категория из кэша справочников """
+    return (await get_reference_data(session)).categories_by_id.get(category_id)
 
 
-async def add_category(name: str, description: str = None) -> Category:
-    async with async_session() as session:
+async def add_category(
+    name: str,
+    description: str = None,
+    session: Optional[AsyncSession] = None
+) -> Category:
+    async with session_scope(session, commit=True) as session:
         category = Category(name=name, description=description)
         session.add(category)
-        await session.commit()
-        await session.refresh(category)
+        await session.flush()
+        session.info.pop('reference_data', None)
+        invalidate_on_commit(session, reference_cache.invalidate)
         return category
 
 
-# --- Методы: Товары ---
-async def get_products_by_shop(shop_id: int) -> List[Product]:
-    async with async_session() as session:
-        result = await session.execute(select(Product).where(Product.shop_id == shop_id))
+# --- Методы: Справочники ---
+async def get_all_shops_with_country(session: Optional[AsyncSession] = None) -> List[Shop]:
+    """Все магазины с загруженной страной (shop.country) одним запросом"""
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select(Shop)
+            .join(Shop.country)
+            .options(contains_eager(Shop.country))
+            .order_by(Country.id, Shop.id)
+        )
         return result.scalars().all()
 
 
-async def get_products_by_category(category_id: int) -> List[Product]:
-    async with async_session() as session:
-        result = await session.execute(select(Product).where(Product.category_id == category_id))
-        return result.scalars().all()
+async def get_reference_data(session: Optional[AsyncSession] = None) -> ReferenceData:
+    """Снимок справочников (страны, магазины, категории) из кэша или из БД.
+
+    Через снимок читают get_all_countries, get_country_by_id, get_shops_by_country,
+    get_shop_by_id, get_all_categories и get_category_by_id. В кэше хранятся
+    неизменяемые снимки (CountrySnapshot, ShopSnapshot, CategorySnapshot),
+    а не ORM-объекты. Снимок читается в session и попадает в кэш после
+    фиксации её транзакции; до этого он хранится в session.info, чтобы
+    несколько обращений в одном апдейте не загружали его повторно.
+    """
+    data = reference_cache.get()
+    if data is not None:
+        return data
+    if session is not None and 'reference_data' in session.info:
+        return session.info['reference_data']
+
+    version = reference_cache.version
+    async with session_scope(session) as session:
+        countries = (await session.execute(select(Country).order_by(Country.id))).scalars().all()
+        shops = await get_all_shops_with_country(session=session)
+        categories = (await session.execute(select(Category).order_by(Category.id))).scalars().all()
+        data = ReferenceData(
+            [snapshot(CountrySnapshot, country) for country in countries],
+            [
+                snapshot(
+                    ShopSnapshot,
+                    shop,
+                    country_name=shop.country.name,
+                    country_flag_emoji=shop.country.flag_emoji
+                )
+                for shop in shops
+            ],
+            [snapshot(CategorySnapshot, category) for category in categories]
+        )
+        session.info['reference_data'] = data
 
+    def fill():
+        session.info.pop('reference_data', None)
+        reference_cache.set(data, version)
 
-async def get_product_by_id(product_id: int) -> Optional[Product]:
-    async with async_session() as session:
-        return await get_one(session, select(Product).where(Product.id == product_id))
+    cache_after_commit(session, fill)
+    return data
+
+
+# --- Методы: Товары ---
+async def get_product_by_id(product_id: int, session: Optional[AsyncSession] = None) -> Optional[ProductSnapshot]:
+    """Снимок товара из кэша карточек или из БД.
+
+    Возвращается неизменяемый ProductSnapshot (только столбцы товара), общий
+    для всех апдейтов; для изменения товара есть update_product/delete_product.
+    Товар читается в session, а в кэш попадает после фиксации её транзакции.
+    """
+    product = product_cache.get(product_id)
+    if product is not None:
+        return product
+
+    version = product_cache.version
+    async with session_scope(session) as session:
+        product = await get_one(session, select(Product).where(Product.id == product_id))
+    if product is None:
+        return None
+
+    product = snapshot(ProductSnapshot, product)
+    cache_after_commit(session, lambda: product_cache.set(product_id, product, version))
+    return product
 
 
 async def add_product(
@@ -170,9 +511,10 @@ async def add_product(
     currency: str,
     weight: float = None,
     photo_url: str = None,
-    photo_file_id: str = None
+    photo_file_id: str = None,
+    session: Optional[AsyncSession] = None
 ) -> Product:
-    async with async_session() as session:
+    async with session_scope(session, commit=True) as session:
         product = Product(
             shop_id=shop_id,
             category_id=category_id,
@@ -185,8 +527,8 @@ async def add_product(
             photo_file_id=photo_file_id
         )
         session.add(product)
-        await session.commit()
-        await session.refresh(product)
+        await session.flush()
+        invalidate_on_commit(session, lambda: product_cache.invalidate(product.id))
         return product
 
 
@@ -195,7 +537,8 @@ async def update_product(
     name: str = None,
     description: str = None,
     price_original: float = None,
-    photo_file_id: str = None
+    photo_file_id: str = None,
+    session: Optional[AsyncSession] = None
 ) -> None:
     update_data = {}
     if name:
@@ -208,48 +551,86 @@ async def update_product(
         update_data["photo_file_id"] = photo_file_id
 
     if update_data:
-        async with async_session() as session:
+        async with session_scope(session, commit=True) as session:
             await session.execute(
                 update(Product).where(Product.id == product_id).values(**update_data)
             )
-            await session.commit()
+            invalidate_on_commit(session, lambda: product_cache.invalidate(product_id))
 
 
-async def delete_product(product_id: int) -> None:
-    async with async_session() as session:
+async def delete_product(product_id: int, session: Optional[AsyncSession] = None) -> None:
+    async with session_scope(session, commit=True) as session:
         await session.execute(delete(Product).where(Product.id == product_id))
-        await session.commit()
+        invalidate_on_commit(session, lambda: product_cache.invalidate(product_id))
 
 
 # --- Методы: Курсы валют ---
-async def get_exchange_rate(currency: str) -> Optional[ExchangeRate]:
-    async with async_session() as session:
-        return await get_one(session, select(ExchangeRate).where(ExchangeRate.currency == currency))
+async def get_all_exchange_rates(session: Optional[AsyncSession] = None) -> List[ExchangeRate]:
+    async with session_scope(session) as session:
+        result = await session.execute(select(ExchangeRate))
+        return result.scalars().all()
 
 
-async def set_exchange_rate(currency: str, rate_to_rub: float) -> ExchangeRate:
-    async with async_session() as session:
-        rate = await get_one(session, select(ExchangeRate).where(ExchangeRate.currency == currency))
-        if rate:
-            await session.execute(
-                update(ExchangeRate)
-                .where(ExchangeRate.currency == currency)
-                .values(rate_to_rub=rate_to_rub, update_date=datetime.now())
-            )
-            await session.commit()
-            return await get_one(session, select(ExchangeRate).where(ExchangeRate.currency == currency))
-        else:
-            new_rate = ExchangeRate(currency=currency, rate_to_rub=rate_to_rub)
-            session.add(new_rate)
-            await session.commit()
-            await session.refresh(new_rate)
-            return new_rate
+async def get_rates(session: Optional[AsyncSession] = None) -> Dict[str, float]:
+    """Курсы валют к рублю {валюта: курс}: из кэша или одним запросом к БД.
+
+    Кэш общий для всех апдейтов, поэтому курсы загружаются в собственной
+    короткой сессии (session не используется): незафиксированный курс из
+    транзакции апдейта не должен попасть в кэш. Промах бывает раз в
+    EXCHANGE_RATES_CACHE_TTL, так что лишнее соединение берется редко.
+    """
+    rates = rates_cache.get()
+    if rates is not None:
+        return rates
+
+    # Блокировка не дает параллельным апдейтам загружать курсы одновременно
+    async with _rates_lock:
+        rates = rates_cache.get()
+        if rates is None:
+            rates = {rate.currency: rate.rate_to_rub for rate in await get_all_exchange_rates()}
+            rates_cache.set(rates)
+    return rates
+
+
+async def set_exchange_rate(
+    currency: str,
+    rate_to_rub: float,
+    session: Optional[AsyncSession] = None
+) -> ExchangeRate:
+    rates = await set_exchange_rates({currency: rate_to_rub}, session=session)
+    return rates[0]
+
+
+async def set_exchange_rates(
+    rates: Dict[str, float],
+    session: Optional[AsyncSession] = None
+) -> List[ExchangeRate]:
+    """Установить курсы нескольких валют одним запросом (INSERT ... ON CONFLICT)"""
+    if not rates:
+        return []
+
+    now = datetime.now()
+    stmt = upsert(ExchangeRate).values([
+        {'currency': currency, 'rate_to_rub': rate_to_rub, 'update_date': now}
+        for currency, rate_to_rub in rates.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExchangeRate.currency],
+        set_={'rate_to_rub': stmt.excluded.rate_to_rub, 'update_date': stmt.excluded.update_date}
+    ).returning(ExchangeRate)
+
+    async with session_scope(session, commit=True) as session:
+        result = await session.scalars(stmt, execution_options={'populate_existing': True})
+        updated = result.all()
+        # Кэш обновляется только после фиксации: откаченный курс не должен в него попасть
+        on_commit(session, lambda: [rates_cache.update(currency, rate) for currency, rate in rates.items()])
+    return updated
 
 
 # --- Методы: Корзина ---
-async def get_cart_items(client_id: int) -> List[tuple]:
+async def get_cart_items(client_id: int, session: Optional[AsyncSession] = None) -> List[tuple]:
     """Возвращает список кортежей (CartItem, Product)"""
-    async with async_session() as session:
+    async with session_scope(session) as session:
         result = await session.execute(
             select(CartItem, Product)
             .join(Product, CartItem.product_id == Product.id)
@@ -258,46 +639,47 @@ async def get_cart_items(client_id: int) -> List[tuple]:
         return result.all()
 
 
-async def add_to_cart(client_id: int, product_id: int, quantity: int = 1) -> CartItem:
-    async with async_session() as session:
-        # Проверяем, есть ли уже товар в корзине
-        cart_item = await get_one(
-            session,
-            select(CartItem).where(
-                CartItem.client_id == client_id,
-                CartItem.product_id == product_id
-            )
-        )
-        if cart_item:
-            # Увеличиваем количество
-            await session.execute(
-                update(CartItem)
-                .where(CartItem.id == cart_item.id)
-                .values(quantity=cart_item.quantity + quantity)
-            )
-        else:
-            # Добавляем новый товар
-            cart_item = CartItem(client_id=client_id, product_id=product_id, quantity=quantity)
-            session.add(cart_item)
-        await session.commit()
-        return cart_item
-
-
-async def remove_from_cart(client_id: int, product_id: int) -> None:
-    async with async_session() as session:
+async def add_to_cart(
+    client_id: int,
+    product_id: int,
+    quantity: int = 1,
+    session: Optional[AsyncSession] = None
+) -> Optional[CartItem]:
+    """Добавить товар или увеличить его количество одним запросом (INSERT ... ON CONFLICT).
+
+    Возвращает None, если товара уже нет в БД: снимок из кэша мог устареть,
+    когда товар удален в другом воркере.
+    """
+    stmt = upsert(CartItem).values(client_id=client_id, product_id=product_id, quantity=quantity)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.client_id, CartItem.product_id],
+        set_={'quantity': CartItem.quantity + stmt.excluded.quantity}
+    ).returning(CartItem)
+
+    async with session_scope(session, commit=True) as session:
+        try:
+            # Точка сохранения: нарушение внешнего ключа откатывает только вставку
+            async with session.begin_nested():
+                result = await session.scalars(stmt, execution_options={'populate_existing': True})
+                return result.one()
+        except IntegrityError:
+            product_cache.invalidate(product_id)
+            return None
+
+
+async def remove_from_cart(client_id: int, product_id: int, session: Optional[AsyncSession] = None) -> None:
+    async with session_scope(session, commit=True) as session:
         await session.execute(
             delete(CartItem).where(
                 CartItem.client_id == client_id,
                 CartItem.product_id == product_id
             )
         )
-        await session.commit()
 
 
-async def clear_cart(client_id: int) -> None:
-    async with async_session() as session:
+async def clear_cart(client_id: int, session: Optional[AsyncSession] = None) -> None:
+    async with session_scope(session, commit=True) as session:
         await session.execute(delete(CartItem).where(CartItem.client_id == client_id))
-        await session.commit()
 
 
 # --- Методы: Заказы ---
@@ -307,93 +689,424 @@ async def create_order(
     delivery_cost: float,
     customs_fee: float,
     delivery_type: str,
-    cart_items: List[tuple]
+    items: List[dict],
+    from_cart: bool = True,
+    idempotency_key: Optional[str] = None,
+    session: Optional[AsyncSession] = None
 ) -> Order:
-    async with async_session() as session:
-        tracking_number = generate_tracking_number()
-        order = Order(
-            client_id=client_id,
-            total_amount=total_amount,
-            delivery_cost=delivery_cost,
-            customs_fee=customs_fee,
-            delivery_type=delivery_type,
-            tracking_number=tracking_number
+    """Создать заказ из снимка корзины (см. utils.CheckoutItem).
+
+    Заказ вставляется с RETURNING, товары - одним многострочным INSERT;
+    при from_cart корзина клиента очищается в той же транзакции.
+    """
+    async with session_scope(session, commit=True) as session:
+        order = await session.scalar(
+            insert(Order)
+            .values(
+                client_id=client_id,
+                total_amount=total_amount,
+                delivery_cost=delivery_cost,
+                customs_fee=customs_fee,
+                delivery_type=delivery_type,
+                tracking_number=generate_tracking_number(),
+                idempotency_key=idempotency_key
+            )
+            .returning(Order)
         )
-        session.add(order)
-        await session.flush()
 
-        # Добавляем товары в заказ
-        for cart_item, product in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                quantity=cart_item.quantity,
-                price_rub=product.price_original  # Здесь должна быть цена в рублях
+        if items:
+            await session.execute(
+                insert(OrderItem).values([
+                    {
+                        'order_id': order.id,
+                        'product_id': item['product_id'],
+                        'quantity': item['quantity'],
+                        'price_rub': item['price_original']  # Здесь должна быть цена в рублях
+                    }
+                    for item in items
+                ])
             )
-            session.add(order_item)
 
-        await session.commit()
-        await session.refresh(order)
+        if from_cart:
+            await session.execute(delete(CartItem).where(CartItem.client_id == client_id))
+
         return order
 
 
-async def get_client_orders(client_id: int) -> List[Order]:
-    async with async_session() as session:
+async def checkout(
+    client_id: int,
+    delivery_type: str,
+    idempotency_key: str,
+    session: Optional[AsyncSession] = None
+) -> Tuple[Optional[Order], bool]:
+    """Оформить заказ из корзины клиента одной транзакцией.
+
+    Возвращает (заказ, создан ли он сейчас). Повторный вызов с тем же ключом
+    (двойное нажатие, повторная доставка апдейта) возвращает уже созданный заказ;
+    (None, False) - корзина пуста.
+    """
+    by_key = select(Order).where(Order.idempotency_key == idempotency_key)
+    async with session_scope(session, commit=True) as session:
+        order = await get_one(session, by_key)
+        if order:
+            return order, False
+
+        # Блокируем строки корзины: параллельное оформление этого клиента ждет здесь
+        result = await session.execute(
+            select(CartItem, Product)
+            .join(Product, CartItem.product_id == Product.id)
+            .where(CartItem.client_id == client_id)
+            .order_by(CartItem.id)
+            .with_for_update(of=CartItem)
+        )
+        cart_items = result.all()
+        if not cart_items:
+            # Корзину могла только что оформить параллельная транзакция с тем же ключом
+            return await get_one(session, by_key), False
+
+        items = snapshot_cart_items(cart_items)
+        totals = await calculate_order_totals(items, await get_rates(session=session), delivery_type)
+        try:
+            # Точка сохранения: при гонке с тем же ключом откатывается только вставка
+            async with session.begin_nested():
+                order = await create_order(
+                    client_id=client_id,
+                    total_amount=totals['total'],
+                    delivery_cost=totals['delivery_cost'],
+                    customs_fee=totals['customs_fee'],
+                    delivery_type=delivery_type,
+                    items=items,
+                    idempotency_key=idempotency_key,
+                    session=session
+                )
+        except IntegrityError:
+            # Без блокировок строк (SQLite) заказ с этим ключом мог успеть создать параллельный вызов
+            order = await get_one(session, by_key)
+            if order is None:
+                raise
+            return order, False
+
+        return order, True
+
+
+def _order_conditions(
+    client_id: Optional[int] = None,
+    status: Optional[str] = None,
+    delivery_type: Optional[str] = None,
+    date_from: Optional[datetime] = None
+) -> list:
+    """Условия WHERE для фильтров списка заказов"""
+    conditions = []
+    if client_id is not None:
+        conditions.append(Order.client_id == client_id)
+    if status is not None:
+        conditions.append(Order.status == status)
+    if delivery_type is not None:
+        conditions.append(Order.delivery_type == delivery_type)
+    if date_from is not None:
+        conditions.append(Order.order_date >= date_from)
+    return conditions
+
+
+async def count_orders(
+    client_id: Optional[int] = None,
+    status: Optional[str] = None,
+    delivery_type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    session: Optional[AsyncSession] = None
+) -> int:
+    async with session_scope(session) as session:
+        return await session.scalar(
+            select(func.count(Order.id)).where(*_order_conditions(client_id, status, delivery_type, date_from))
+        )
+
+
+async def get_orders_page(
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    client_id: Optional[int] = None,
+    status: Optional[str] = None,
+    delivery_type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    session: Optional[AsyncSession] = None
+) -> Tuple[List[Order], bool]:
+    """Страница заказов (новые сверху), keyset-пагинация по (order_date, id).
+
+    after - курсор следующей страницы (последний заказ текущей), before -
+    курсор предыдущей (первый заказ текущей). Второй элемент результата -
+    есть ли еще заказы в направлении листания. Остальные параметры - фильтры.
+    """
+    return await get_keyset_page(
+        select(Order).where(*_order_conditions(client_id, status, delivery_type, date_from)),
+        (Order.order_date, Order.id),
+        limit,
+        after=after,
+        before=before,
+        session=session
+    )
+
+
+async def get_client_order_stats(client_id: int, session: Optional[AsyncSession] = None) -> Dict[str, float]:
+    """Статистика заказов клиента одним запросом (COUNT/SUM ... FILTER)"""
+    finished = Order.status.in_(['✅ Получен', '❌ Отменен'])
+    async with session_scope(session) as session:
         result = await session.execute(
-            select(Order)
+            select(
+                func.count(Order.id).label('total_orders'),
+                func.count(Order.id).filter(~finished).label('active_orders'),
+                func.count(Order.id).filter(Order.status == '✅ Получен').label('completed_orders'),
+                func.coalesce(func.sum(Order.total_amount), 0.0).label('total_spent')
+            )
             .where(Order.client_id == client_id)
-            .order_by(Order.order_date.desc())
         )
-        return result.scalars().all()
+        return dict(result.one()._mapping)
+
+
+async def get_order_detail(
+    order_id: int,
+    telegram_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None
+) -> Optional[Order]:
+    """Заказ вместе с клиентом и товарами одним запросом.
+
+    При переданном telegram_id заказ возвращается, только если принадлежит этому клиенту.
+    """
+    stmt = (
+        select(Order)
+        .where(Order.id == order_id)
+        .options(
+            joinedload(Order.client),
+            joinedload(Order.order_items).joinedload(OrderItem.product)
+        )
+        .execution_options(populate_existing=True)
+    )
+    if telegram_id is not None:
+        stmt = stmt.where(Order.client.has(Client.telegram_id == telegram_id))
+
+    async with session_scope(session) as session:
+        result = await session.execute(stmt)
+        return result.unique().scalar_one_or_none()
 
 
-async def get_order_by_id(order_id: int) -> Optional[Order]:
-    async with async_session() as session:
-        return await get_one(session, select(Order).where(Order.id == order_id))
+async def update_order_status(order_id: int, status: str, session: Optional[AsyncSession] = None) -> None:
+    async with session_scope(session, commit=True) as session:
+        await session.execute(
+            update(Order).where(Order.id == order_id).values(status=status)
+        )
 
 
-async def get_order_items(order_id: int) -> List[tuple]:
-    """Возвращает список кортежей (OrderItem, Product)"""
-    async with async_session() as session:
+async def cancel_order(order_id: int, session: Optional[AsyncSession] = None) -> None:
+    await update_order_status(order_id, '❌ Отменен', session=session)
+
+
+# --- Методы: Рассылки ---
+async def create_broadcast_job(
+    admin_chat_id: int,
+    payload: dict,
+    total: int,
+    progress_message_id: Optional[int] = None,
+    idempotency_key: Optional[str] = None,
+    session: Optional[AsyncSession] = None
+) -> Tuple[BroadcastJob, bool]:
+    """Поставить рассылку в очередь.
+
+    Возвращает (задание, создано ли оно сейчас). Повторный вызов с тем же ключом
+    (двойное нажатие на подтверждение) возвращает уже созданное задание.
+    """
+    by_key = select(BroadcastJob).where(BroadcastJob.idempotency_key == idempotency_key)
+    async with session_scope(session, commit=True) as session:
+        if idempotency_key is not None:
+            job = await get_one(session, by_key)
+            if job:
+                return job, False
+
+        job = BroadcastJob(
+            message_type=payload['message_type'],
+            content=payload.get('content'),
+            caption=payload.get('caption'),
+            file_id=payload.get('file_id'),
+            file_name=payload.get('file_name'),
+            total=total,
+            admin_chat_id=admin_chat_id,
+            progress_message_id=progress_message_id,
+            idempotency_key=idempotency_key
+        )
+        try:
+            # Точка сохранения: при гонке с тем же ключом откатывается только вставка
+            async with session.begin_nested():
+                session.add(job)
+                await session.flush()
+        except IntegrityError:
+            existing = await get_one(session, by_key) if idempotency_key is not None else None
+            if existing is None:
+                raise
+            return existing, False
+        return job, True
+
+
+async def get_broadcast_job_by_key(idempotency_key: str, session: Optional[AsyncSession] = None) -> Optional[BroadcastJob]:
+    async with session_scope(session) as session:
+        return await get_one(session, select(BroadcastJob).where(BroadcastJob.idempotency_key == idempotency_key))
+
+
+async def claim_broadcast_job(
+    worker_id: str,
+    lease_seconds: int,
+    session: Optional[AsyncSession] = None
+) -> Optional[BroadcastJob]:
+    """Захватить ожидающее задание или задание, воркер которого перестал отмечаться"""
+    stale_before = datetime.now() - timedelta(seconds=lease_seconds)
+    available = or_(
+        BroadcastJob.status == 'pending',
+        and_(BroadcastJob.status == 'running', BroadcastJob.heartbeat_at < stale_before)
+    )
+    async with session_scope(session, commit=True) as session:
+        job_id = await session.scalar(
+            select(BroadcastJob.id).where(available).order_by(BroadcastJob.id).limit(1)
+        )
+        if job_id is None:
+            return None
+
+        # Условие повторяется в UPDATE: из двух воркеров задание получит только один
         result = await session.execute(
-            select(OrderItem, Product)
-            .join(Product, OrderItem.product_id == Product.id)
-            .where(OrderItem.order_id == order_id)
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, available)
+            .values(status='running', worker_id=worker_id, heartbeat_at=datetime.now())
         )
-        return result.all()
+        if result.rowcount != 1:
+            return None
 
+        return await session.get(BroadcastJob, job_id, populate_existing=True)
 
-async def update_order_status(order_id: int, status: str) -> None:
-    async with async_session() as session:
-        await session.execute(
-            update(Order).where(Order.id == order_id).values(status=status)
+
+async def renew_broadcast_lease(job_id: int, worker_id: str, session: Optional[AsyncSession] = None) -> bool:
+    """Отметить, что воркер еще выполняет задание; False - задание перехвачено"""
+    async with session_scope(session, commit=True) as session:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.id == job_id,
+                BroadcastJob.worker_id == worker_id,
+                BroadcastJob.status == 'running'
+            )
+            .values(heartbeat_at=datetime.now())
+        )
+        return result.rowcount == 1
+
+
+async def get_broadcast_recipients(
+    job_id: int,
+    after_client_id: int,
+    limit: int,
+    session: Optional[AsyncSession] = None
+) -> List[Tuple[int, int]]:
+    """Следующая пачка получателей (id клиента, telegram_id) после контрольной точки,
+    без уже обработанных в рамках задания"""
+    delivered = (
+        select(BroadcastDelivery.id)
+        .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.client_id == Client.id)
+        .exists()
+    )
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select(Client.id, Client.telegram_id)
+            .where(Client.id > after_client_id, ~delivered)
+            .order_by(Client.id)
+            .limit(limit)
         )
-        await session.commit()
+        return [tuple(row) for row in result.all()]
 
 
-async def cancel_order(order_id: int) -> None:
-    await update_order_status(order_id, '❌ Отменен')
+async def save_broadcast_checkpoint(
+    job_id: int,
+    worker_id: str,
+    deliveries: List[Tuple[int, str]],
+    last_client_id: int,
+    session: Optional[AsyncSession] = None
+) -> bool:
+    """Сохранить результаты пачки и сдвинуть контрольную точку одной транзакцией.
 
+    Возвращает False, если задание перехвачено другим воркером.
+    """
+    counts = {'sent': 0, 'blocked': 0, 'failed': 0}
+    for _, status in deliveries:
+        counts[status] += 1
 
-async def get_all_orders() -> List[Order]:
-    async with async_session() as session:
-        result = await session.execute(select(Order).order_by(Order.order_date.desc()))
-        return result.scalars().all()
+    async with session_scope(session, commit=True) as session:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.id == job_id,
+                BroadcastJob.worker_id == worker_id,
+                BroadcastJob.status == 'running'
+            )
+            .values(
+                sent=BroadcastJob.sent + counts['sent'],
+                blocked=BroadcastJob.blocked + counts['blocked'],
+                failed=BroadcastJob.failed + counts['failed'],
+                last_client_id=last_client_id,
+                heartbeat_at=datetime.now()
+            )
+        )
+        if result.rowcount != 1:
+            return False
+
+        if deliveries:
+            await session.execute(
+                insert(BroadcastDelivery),
+                [
+                    {'job_id': job_id, 'client_id': client_id, 'status': status}
+                    for client_id, status in deliveries
+                ]
+            )
+        return True
+
+
+async def finish_broadcast_job(
+    job_id: int,
+    worker_id: str,
+    session: Optional[AsyncSession] = None
+) -> Optional[BroadcastJob]:
+    async with session_scope(session, commit=True) as session:
+        await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.worker_id == worker_id)
+            .values(status='finished', finished_at=datetime.now(), heartbeat_at=datetime.now())
+        )
+        return await session.get(BroadcastJob, job_id, populate_existing=True)
+
+
+async def release_broadcast_job(
+    job_id: int,
+    worker_id: str,
+    session: Optional[AsyncSession] = None
+):
+    """Вернуть задание в очередь (остановка бота), чтобы его сразу подхватил другой воркер"""
+    async with session_scope(session, commit=True) as session:
+        await session.execute(
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.id == job_id,
+                BroadcastJob.worker_id == worker_id,
+                BroadcastJob.status == 'running'
+            )
+            .values(status='pending', worker_id=None, heartbeat_at=None)
+        )
 
 
 # --- Методы: Администраторы ---
-async def is_admin(telegram_id: int) -> bool:
-    async with async_session() as session:
+async def is_admin(telegram_id: int, session: Optional[AsyncSession] = None) -> bool:
+    async with session_scope(session) as session:
         admin = await get_one(session, select(Admin).where(Admin.telegram_id == telegram_id))
         return admin is not None
 
 
-async def add_admin(telegram_id: int, name: str) -> Admin:
-    async with async_session() as session:
+async def add_admin(telegram_id: int, name: str, session: Optional[AsyncSession] = None) -> Admin:
+    async with session_scope(session, commit=True) as session:
         admin = Admin(telegram_id=telegram_id, name=name)
         session.add(admin)
-        await session.commit()
-        await session.refresh(admin)
+        await session.flush()
         return admin
 
 
@@ -401,21 +1114,84 @@ async def add_admin(telegram_id: int, name: str) -> Admin:
 async def close_db():
     await engine.dispose()
 
-# --- Методы: Товары (дополнительные функции) ---
 
-async def get_all_products() -> List[Product]:
-    """Получить все товары"""
-    async with async_session() as session:
-        result = await session.execute(select(Product).order_by(Product.id.desc()))
-        return result.scalars().all()
+# --- Мониторинг пула соединений ---
+def get_pool_stats() -> Dict[str, float]:
+    """Текущее состояние пула и накопленные метрики ожидания соединений"""
+    stats = {}
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        stats.update(
+            pool_size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0)
+        )
+    stats.update(pool_metrics.snapshot())
+    return stats
 
 
-async def get_products_by_shop_and_category(shop_id: int, category_id: int) -> List[Product]:
-    """Получить товары по магазину и категории"""
-    async with async_session() as session:
-        result = await session.execute(
-            select(Product)
-            .where(Product.shop_id == shop_id, Product.category_id == category_id)
-            .order_by(Product.id.desc())
+def get_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Размер и счетчики попаданий кэшей в памяти процесса"""
+    return {'products': product_cache.stats(), 'clients': client_cache.stats()}
+
+# --- Методы: Товары (дополнительные функции) ---
+
+async def get_products_page(
+    shop_id: int,
+    category_id: int,
+    limit: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None
+) -> Tuple[List[Product], bool]:
+    """Страница товаров магазина в категории (новые сверху), keyset-пагинация по id.
+
+    after_id - курсор следующей страницы (последний id текущей), before_id -
+    курсор предыдущей (первый id текущей). Второй элемент результата -
+    есть ли еще товары в направлении листания.
+    """
+    return await get_keyset_page(
+        select(Product).where(Product.shop_id == shop_id, Product.category_id == category_id),
+        (Product.id,),
+        limit,
+        after=(after_id,) if after_id is not None else None,
+        before=(before_id,) if before_id is not None else None,
+        session=session
+    )
+
+
+async def get_admin_products_page(
+    limit: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None
+) -> Tuple[List[tuple], bool]:
+    """Страница всех товаров для админа (новые сверху) с названиями магазина и категории.
+
+    Магазин и категория присоединяются в том же запросе, поэтому страница
+    загружается одним запросом. Строки содержат поля id, name, price_original,
+    currency, shop_name и category_name. Курсоры и второй элемент результата -
+    как в get_products_page.
+    """
+    stmt = (
+        select(
+            Product.id,
+            Product.name,
+            Product.price_original,
+            Product.currency,
+            Shop.name.label('shop_name'),
+            Category.name.label('category_name')
         )
-        return result.scalars().all()
\ No newline at end of file
+        .outerjoin(Shop, Shop.id == Product.shop_id)
+        .outerjoin(Category, Category.id == Product.category_id)
+    )
+    return await get_keyset_page(
+        stmt,
+        (Product.id,),
+        limit,
+        after=(after_id,) if after_id is not None else None,
+        before=(before_id,) if before_id is not None else None,
+        scalars=False,
+        session=session
+    )
@@ -0,0 +1,170 @@
+# --- Импорты ---
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, BaseEventIsolation, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from config import (
+    FSM_STORAGE, REDIS_URL, FSM_STATE_TTL, FSM_LOCK_POOL_SIZE,
+    DATABASE_URL, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+from database import async_session
+from models import FsmState
+
+
+# --- Хранилище FSM в базе данных ---
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states основной базы данных.
+
+    Состояние и данные пользователя хранятся одной строкой; строки, не
+    обновлявшиеся дольше ttl секунд, считаются пустыми.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, ttl: int = 0):
+        self.session_pool = session_pool
+        self.ttl = ttl
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        """Строковый ключ строки: bot_id:chat_id:user_id:thread_id:destiny"""
+        parts = (key.bot_id, key.chat_id, key.user_id, key.thread_id or '', key.destiny)
+        return ":".join(str(part) for part in parts)
+
+    def _is_expired(self, row: FsmState) -> bool:
+        return bool(self.ttl) and row.updated_at < datetime.now() - timedelta(seconds=self.ttl)
+
+    async def _load(self, key: StorageKey) -> Optional[FsmState]:
+        async with self.session_pool() as session:
+            row = await session.get(FsmState, self.build_key(key))
+        if row is None or self._is_expired(row):
+            return None
+        return row
+
+    async def _save(self, key: StorageKey, **values: Any) -> None:
+        """Изменить состояние и/или данные; пустая запись удаляется"""
+        storage_key = self.build_key(key)
+        async with self.session_pool() as session:
+            # Строка блокируется до коммита, чтобы запись из другого воркера не потерялась
+            row = await session.get(FsmState, storage_key, with_for_update=True)
+            current = {'state': None, 'data': {}}
+            if row is not None and not self._is_expired(row):
+                current = {'state': row.state, 'data': row.data}
+            current.update(values)
+
+            if current['state'] is None and not current['data']:
+                if row is not None:
+                    await session.delete(row)
+            elif row is None:
+                session.add(FsmState(key=storage_key, updated_at=datetime.now(), **current))
+            else:
+                row.state = current['state']
+                row.data = current['data']
+                row.updated_at = datetime.now()
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._save(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._load(key)
+        return row.state if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._save(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._load(key)
+        return dict(row.data) if row else {}
+
+    async def delete_expired(self) -> int:
+        """Удалить устаревшие записи, вернуть их количество"""
+        if not self.ttl:
+            return 0
+        async with self.session_pool() as session:
+            result = await session.execute(
+                delete(FsmState).where(FsmState.updated_at < datetime.now() - timedelta(seconds=self.ttl))
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def close(self) -> None:
+        # Соединения принадлежат общему движку и закрываются в close_db()
+        pass
+
+    def create_isolation(self) -> BaseEventIsolation:
+        """Блокировка апдейтов одного пользователя: между воркерами для PostgreSQL,
+        в пределах процесса для SQLite (локальная разработка, один воркер)"""
+        if DATABASE_URL.startswith('postgresql'):
+            return DatabaseEventIsolation(create_async_engine(
+                DATABASE_URL,
+                pool_size=FSM_LOCK_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=DB_POOL_PRE_PING
+            ))
+        return SimpleEventIsolation()
+
+
+class DatabaseEventIsolation(BaseEventIsolation):
+    """Блокировка апдейтов одного пользователя между воркерами через
+    рекомендательные блокировки PostgreSQL (pg_advisory_lock).
+
+    Блокировка держит соединение, пока обрабатывается апдейт, поэтому у нее свой
+    небольшой пул: из общего пула апдейты забрали бы соединения, нужные
+    обработчикам, и ждали бы друг друга до DB_POOL_TIMEOUT.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        params = {'key': DatabaseStorage.build_key(key)}
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT pg_advisory_lock(hashtextextended(:key, 0))"), params)
+            try:
+                yield
+            finally:
+                await connection.execute(text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))"), params)
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+
+# --- Выбор хранилища по настройкам ---
+def create_storage() -> BaseStorage:
+    """Создать FSM-хранилище согласно FSM_STORAGE из config.py"""
+    ttl = FSM_STATE_TTL or None
+
+    if FSM_STORAGE in ('redis', 'fakeredis'):
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("❌ Для FSM_STORAGE=redis установите пакет redis: pip install redis")
+
+        if FSM_STORAGE == 'redis':
+            return RedisStorage.from_url(REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+
+        # Встроенная замена Redis для тестов: тот же RedisStorage, но без сервера
+        try:
+            from fakeredis.aioredis import FakeRedis
+        except ImportError:
+            raise RuntimeError("❌ Для FSM_STORAGE=fakeredis установите пакет fakeredis: pip install fakeredis")
+        return RedisStorage(FakeRedis(), state_ttl=ttl, data_ttl=ttl)
+
+    if FSM_STORAGE == 'database':
+        return DatabaseStorage(async_session, ttl=FSM_STATE_TTL)
+
+    return MemoryStorage()
+
+
+def create_events_isolation(storage: BaseStorage) -> Optional[BaseEventIsolation]:
+    """Блокировка апдейтов одного пользователя между воркерами (Redis и база данных)"""
+    create_isolation = getattr(storage, 'create_isolation', None)
+    return create_isolation() if create_isolation else None
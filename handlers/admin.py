@@ -1,19 +1,29 @@
 # --- Импорты ---
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
 
 import database
-from config import ADMIN_IDS
-from utils import AdminStates, format_price
+from config import ADMIN_IDS, DELIVERY_TYPES
+from services.broadcast import broadcast_service
+from utils import AdminStates, format_order_details, fit_message, page_flags, ORDER_STATUSES
 from keyboards import (
     get_admin_menu,
     get_main_menu,
+    ORDER_CURSOR_FORMAT,
     get_admin_orders_keyboard,
+    get_admin_orders_filter_keyboard,
     get_admin_order_keyboard,
     get_status_keyboard,
     get_products_management_keyboard,
+    get_admin_products_keyboard,
     get_cancel_keyboard
 )
 
@@ -42,6 +52,36 @@ async def admin_command(message: Message):
     )
 
 
+# --- Команда /db_stats: состояние пула соединений ---
+@router.message(Command("db_stats"))
+async def db_stats_command(message: Message):
+    """Показать метрики пула соединений с базой данных"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет прав доступа.")
+        return
+
+    stats = database.get_pool_stats()
+    text = "🗄️ <b>Пул соединений с БД:</b>\n\n"
+    if 'pool_size' in stats:
+        text += (
+            f"🔌 Размер пула: {stats['pool_size']}\n"
+            f"📤 Выдано: {stats['checked_out']}\n"
+            f"📥 Свободно: {stats['checked_in']}\n"
+            f"➕ Сверх пула: {stats['overflow']}\n\n"
+        )
+    text += (
+        f"🔢 Получений соединения: {stats['checkouts']}\n"
+        f"⏱️ Ожидание (среднее): {stats['wait_avg_ms']:.1f} мс\n"
+        f"⏱️ Ожидание (максимум): {stats['wait_max_ms']:.1f} мс\n"
+        f"⛔ Таймаутов ожидания: {stats['timeouts']}\n\n"
+        f"🔗 Новых подключений к БД: {stats['connects']}\n"
+        f"⏱️ Подключение (среднее): {stats['connect_avg_ms']:.1f} мс\n"
+        f"⏱️ Подключение (максимум): {stats['connect_max_ms']:.1f} мс\n"
+        f"❌ Ошибок подключения: {stats['connect_errors']}"
+    )
+    await message.answer(text)
+
+
 # --- Вход в админ-панель ---
 @router.message(F.text == "🔑 Админ-панель")
 async def admin_panel(message: Message):
@@ -68,25 +108,181 @@ async def back_to_main_menu(message: Message):
     )
 
 
+# --- Список заказов: фильтры и пагинация ---
+ADMIN_ORDERS_PAGE_SIZE = 10
+
+# Период: подпись и глубина в днях (None - за все время, 0 - с начала суток)
+ORDER_PERIODS = {
+    'all': ('За все время', None),
+    'today': ('Сегодня', 0),
+    'week': ('7 дней', 7),
+    'month': ('30 дней', 30)
+}
+
+# Фильтры хранятся в данных FSM администратора (только примитивы)
+DEFAULT_ORDER_FILTERS = {'status': None, 'period': 'all', 'delivery_type': None}
+
+
+def period_start(period: str) -> Optional[datetime]:
+    """Начало периода фильтра по дате заказа"""
+    days = ORDER_PERIODS[period][1]
+    if days is None:
+        return None
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days)
+
+
+async def get_order_filters(state: FSMContext) -> dict:
+    """Текущие фильтры списка заказов"""
+    data = await state.get_data()
+    return data.get('admin_order_filters') or dict(DEFAULT_ORDER_FILTERS)
+
+
+async def render_admin_orders_page(
+    filters: dict,
+    session: AsyncSession,
+    page: int = 0,
+    direction: str = None,
+    cursor: Tuple[datetime, int] = None
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы заказов с учетом фильтров.
+
+    Без курсора строится первая страница; direction 'n' листает вперед
+    от cursor, 'p' - назад.
+    """
+    query = dict(
+        status=filters['status'],
+        delivery_type=filters['delivery_type'],
+        date_from=period_start(filters['period'])
+    )
+    total = await database.count_orders(**query, session=session)
+    orders, has_more = await database.get_orders_page(
+        limit=ADMIN_ORDERS_PAGE_SIZE,
+        after=cursor if direction == 'n' else None,
+        before=cursor if direction == 'p' else None,
+        **query,
+        session=session
+    )
+
+    has_prev, has_next = page_flags(direction, has_more)
+
+    title = f"📊 <b>Все заказы ({total})"
+    if page:
+        title += f", стр. {page + 1}"
+    title += ":</b>"
+
+    text = (
+        f"{title}\n\n"
+        f"📊 Статус: {filters['status'] or 'любой'}\n"
+        f"📅 Период: {ORDER_PERIODS[filters['period']][0]}\n"
+        f"🚚 Доставка: {filters['delivery_type'] or 'любая'}\n\n"
+    )
+    if orders:
+        text += "Выберите заказ для просмотра и управления:"
+    else:
+        text += "📦 Заказов не найдено."
+
+    return text, get_admin_orders_keyboard(orders, page=page, has_prev=has_prev, has_next=has_next)
+
+
 # --- Просмотр всех заказов ---
 @router.message(F.text == "📊 Все заказы")
-async def show_all_orders(message: Message):
+async def show_all_orders(message: Message, state: FSMContext, session: AsyncSession):
     """Показать все заказы"""
     if not is_admin(message.from_user.id):
         await message.answer("❌ У вас нет прав доступа.")
         return
 
-    orders = await database.get_all_orders()
+    filters = dict(DEFAULT_ORDER_FILTERS)
+    await state.update_data(admin_order_filters=filters)
+
+    text, keyboard = await render_admin_orders_page(filters, session)
+    await message.answer(text, reply_markup=keyboard)
 
-    if not orders:
-        await message.answer("📦 Заказов пока нет.")
+
+# --- Пагинация заказов ---
+@router.callback_query(F.data.startswith("aorders_page_"))
+async def process_admin_orders_page(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Переход на соседнюю страницу заказов"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
         return
 
-    await message.answer(
-        f"📊 <b>Все заказы ({len(orders)}):</b>\n\n"
-        "Выберите заказ для просмотра и управления:",
-        reply_markup=get_admin_orders_keyboard(orders)
+    _, _, page, direction, stamp, order_id = callback.data.split("_")
+    cursor = (datetime.strptime(stamp, ORDER_CURSOR_FORMAT), int(order_id))
+
+    text, keyboard = await render_admin_orders_page(
+        await get_order_filters(state), session,
+        page=int(page), direction=direction, cursor=cursor
     )
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# --- Фильтры заказов ---
+@router.callback_query(F.data.startswith("aorders_menu_"))
+async def show_admin_orders_filter(callback: CallbackQuery):
+    """Показать варианты фильтра"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
+        return
+
+    kind = callback.data.split("_", 2)[2]
+    if kind == 'status':
+        title = "📊 <b>Фильтр по статусу:</b>"
+        options = [('all', 'Любой')] + [(str(i), status) for i, status in enumerate(ORDER_STATUSES)]
+    elif kind == 'period':
+        title = "📅 <b>Фильтр по дате заказа:</b>"
+        options = [(key, label) for key, (label, _) in ORDER_PERIODS.items()]
+    else:
+        title = "🚚 <b>Фильтр по типу доставки:</b>"
+        options = [('all', 'Любая')] + [(delivery_type, delivery_type.capitalize()) for delivery_type in DELIVERY_TYPES]
+
+    await callback.message.edit_text(title, reply_markup=get_admin_orders_filter_keyboard(kind, options))
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("aorders_set_"))
+async def set_admin_orders_filter(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Применить фильтр и показать первую страницу"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
+        return
+
+    _, _, kind, value = callback.data.split("_", 3)
+    filters = await get_order_filters(state)
+
+    if kind == 'status':
+        filters['status'] = None if value == 'all' else ORDER_STATUSES[int(value)]
+    elif kind == 'period' and value in ORDER_PERIODS:
+        filters['period'] = value
+    elif kind == 'delivery':
+        filters['delivery_type'] = value if value in DELIVERY_TYPES else None
+
+    await state.update_data(admin_order_filters=filters)
+
+    text, keyboard = await render_admin_orders_page(filters, session)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "aorders_reset")
+async def reset_admin_orders_filter(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Сбросить фильтры списка заказов"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
+        return
+
+    if await get_order_filters(state) == DEFAULT_ORDER_FILTERS:
+        await callback.answer("Фильтры не заданы")
+        return
+
+    filters = dict(DEFAULT_ORDER_FILTERS)
+    await state.update_data(admin_order_filters=filters)
+
+    text, keyboard = await render_admin_orders_page(filters, session)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
 
 
 # --- Управление товарами (главное меню) ---
@@ -105,16 +301,67 @@ async def manage_products(message: Message):
 
 
 # --- Просмотр всех товаров ---
+ADMIN_PRODUCTS_PAGE_SIZE = 30
+
+
+async def render_admin_products_page(
+    session: AsyncSession,
+    page: int = 0,
+    direction: str = None,
+    cursor: int = None
+) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Текст и клавиатура страницы списка товаров; None, если товаров нет.
+
+    Без курсора строится первая страница; direction 'n' листает вперед
+    от cursor, 'p' - назад. Если записи не помещаются в одно сообщение,
+    страница укорачивается, а остаток попадает на следующую.
+    """
+    products, has_more = await database.get_admin_products_page(
+        limit=ADMIN_PRODUCTS_PAGE_SIZE,
+        after_id=cursor if direction == 'n' else None,
+        before_id=cursor if direction == 'p' else None,
+        session=session
+    )
+    if not products:
+        return None
+
+    has_prev, has_next = page_flags(direction, has_more)
+
+    title = "📦 <b>Все товары"
+    if page:
+        title += f", стр. {page + 1}"
+    title += ":</b>\n\n"
+
+    entries = [
+        f"🆔 {product.id}. {product.name}\n"
+        f"   💰 {product.price_original} {product.currency}\n"
+        f"   🏪 {product.shop_name or 'N/A'}\n"
+        f"   📁 {product.category_name or 'N/A'}\n\n"
+        for product in products
+    ]
+    if direction == 'p':
+        # При листании назад к курсору примыкают последние записи - сохраняем их
+        _, count = fit_message(title, entries[::-1])
+        if count < len(products):
+            products, entries, has_prev = products[-count:], entries[-count:], True
+    else:
+        _, count = fit_message(title, entries)
+        if count < len(products):
+            products, entries, has_next = products[:count], entries[:count], True
+    text = title + "".join(entries)
+
+    return text, get_admin_products_keyboard(products, page=page, has_prev=has_prev, has_next=has_next)
+
+
 @router.callback_query(F.data == "view_products")
-async def view_all_products(callback: CallbackQuery):
+async def view_all_products(callback: CallbackQuery, session: AsyncSession):
     """Показать все товары"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
         return
 
-    products = await database.get_all_products()
-
-    if not products:
+    rendered = await render_admin_products_page(session)
+    if rendered is None:
         await callback.message.edit_text(
             "📦 Товаров пока нет.\n\n"
             "Хотите добавить первый товар?",
@@ -122,35 +369,53 @@ async def view_all_products(callback: CallbackQuery):
         )
         return
 
-    text = "📦 <b>Все товары:</b>\n\n"
-    for product in products:
-        shop = await database.get_shop_by_id(product.shop_id)
-        category = await database.get_category_by_id(product.category_id)
-        text += f"🆔 {product.id}. {product.name}\n"
-        text += f"   💰 {product.price_original} {product.currency}\n"
-        text += f"   🏪 {shop.name if shop else 'N/A'}\n"
-        text += f"   📁 {category.name if category else 'N/A'}\n\n"
+    text, keyboard = rendered
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
 
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_products_management_keyboard()
-    )
+
+# --- Пагинация списка товаров ---
+@router.callback_query(F.data.startswith("aproducts_"))
+async def process_admin_products_page(callback: CallbackQuery, session: AsyncSession):
+    """Листание списка товаров"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
+        return
+
+    try:
+        # aproducts_{page}_{p|n}_{id}
+        _, page, direction, product_id = callback.data.split("_")
+        page, cursor = int(page), int(product_id)
+    except ValueError:
+        await callback.answer("❌ Ошибка навигации.", show_alert=True)
+        return
+
+    rendered = await render_admin_products_page(session, page=page, direction=direction, cursor=cursor)
+    if rendered is None:
+        # Товары на краю страницы удалили - начинаем сначала
+        rendered = await render_admin_products_page(session)
+    if rendered is None:
+        await callback.message.edit_text(
+            "📦 Товаров пока нет.",
+            reply_markup=get_products_management_keyboard()
+        )
+        await callback.answer()
+        return
+
+    text, keyboard = rendered
+    await callback.message.edit_text(text, reply_markup=keyboard)
     await callback.answer()
 
 
 # --- Начало добавления товара ---
 @router.callback_query(F.data == "add_product")
-async def start_adding_product(callback: CallbackQuery, state: FSMContext):
+async def start_adding_product(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Начало добавления товара"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
         return
 
-    shops = []
-    countries = await database.get_all_countries()
-    for country in countries:
-        country_shops = await database.get_shops_by_country(country.id)
-        shops.extend(country_shops)
+    shops = (await database.get_reference_data(session)).shops
 
     if not shops:
         await callback.message.edit_text(
@@ -162,7 +427,7 @@ async def start_adding_product(callback: CallbackQuery, state: FSMContext):
 
     text = "📦 <b>Добавление товара</b>\n\n<b>Доступные магазины:</b>\n"
     for shop in shops:
-        text += f"{shop.id}. {shop.name}\n"
+        text += f"{shop.id}. {shop.country_flag_emoji} {shop.name}\n"
 
     text += "\nВведите номер магазина из списка или нажмите 'Отмена' для возврата к прошлому меню:"
 
@@ -176,13 +441,16 @@ async def start_adding_product(callback: CallbackQuery, state: FSMContext):
 
 # --- Удаление товара ---
 @router.callback_query(F.data == "delete_product")
-async def start_deleting_product(callback: CallbackQuery, state: FSMContext):
+async def start_deleting_product(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Начало удаления товара"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
         return
 
-    products = await database.get_all_products()
+    products, has_more = await database.get_admin_products_page(
+        limit=ADMIN_PRODUCTS_PAGE_SIZE,
+        session=session
+    )
 
     if not products:
         await callback.message.edit_text(
@@ -191,11 +459,17 @@ async def start_deleting_product(callback: CallbackQuery, state: FSMContext):
         )
         return
 
-    text = "🗑️ <b>Удаление товара</b>\n\n<b>Доступные товары:</b>\n"
-    for product in products:
-        text += f"{product.id}. {product.name}\n"
-
-    text += "\nВведите номер товара из списка для удаления или нажмите 'Отмена' для возврата к прошлому меню:"
+    footer = "\nВведите номер товара из списка для удаления или нажмите 'Отмена' для возврата к прошлому меню:"
+    if has_more:
+        footer = (
+            "\nПоказаны последние добавленные товары; номера остальных - "
+            "в разделе «Просмотреть все товары».\n" + footer
+        )
+    text, _ = fit_message(
+        "🗑️ <b>Удаление товара</b>\n\n<b>Доступные товары:</b>\n",
+        [f"{product.id}. {product.name}\n" for product in products],
+        footer
+    )
 
     await callback.message.edit_text(
         text,
@@ -207,7 +481,7 @@ async def start_deleting_product(callback: CallbackQuery, state: FSMContext):
 
 # --- Обработка удаления товара ---
 @router.message(AdminStates.deleting_product)
-async def process_delete_product(message: Message, state: FSMContext):
+async def process_delete_product(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка удаления товара"""
     if message.text.strip().lower() == 'отмена':
         await message.answer(
@@ -219,7 +493,7 @@ async def process_delete_product(message: Message, state: FSMContext):
 
     try:
         product_id = int(message.text.strip())
-        product = await database.get_product_by_id(product_id)
+        product = await database.get_product_by_id(product_id, session=session)
 
         if not product:
             await message.answer(
@@ -229,7 +503,7 @@ async def process_delete_product(message: Message, state: FSMContext):
             return
 
         # Удаляем товар
-        await database.delete_product(product_id)
+        await database.delete_product(product_id, session=session)
 
         await message.answer(
             f"✅ Товар '{product.name}' успешно удален!",
@@ -246,7 +520,7 @@ async def process_delete_product(message: Message, state: FSMContext):
 
 # --- Ввод ID магазина (с возможностью отмены) ---
 @router.message(AdminStates.adding_product_shop)
-async def process_product_shop(message: Message, state: FSMContext):
+async def process_product_shop(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода ID магазина с возможностью отмены"""
     if message.text.strip().lower() == 'отмена':
         await message.answer(
@@ -258,7 +532,7 @@ async def process_product_shop(message: Message, state: FSMContext):
 
     try:
         shop_id = int(message.text.strip())
-        shop = await database.get_shop_by_id(shop_id)
+        shop = await database.get_shop_by_id(shop_id, session=session)
 
         if not shop:
             await message.answer(
@@ -269,7 +543,7 @@ async def process_product_shop(message: Message, state: FSMContext):
 
         await state.update_data(shop_id=shop_id)
 
-        categories = await database.get_all_categories()
+        categories = await database.get_all_categories(session=session)
         text = "<b>Доступные категории:</b>\n"
         for category in categories:
             text += f"{category.id}. {category.name}\n"
@@ -291,7 +565,7 @@ async def process_product_shop(message: Message, state: FSMContext):
 
 # --- Ввод ID категории (с возможностью отмены) ---
 @router.message(AdminStates.adding_product_category)
-async def process_product_category(message: Message, state: FSMContext):
+async def process_product_category(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода ID категории с возможностью отмены"""
     if message.text.strip().lower() == 'отмена':
         await message.answer(
@@ -303,7 +577,7 @@ async def process_product_category(message: Message, state: FSMContext):
 
     try:
         category_id = int(message.text.strip())
-        category = await database.get_category_by_id(category_id)
+        category = await database.get_category_by_id(category_id, session=session)
 
         if not category:
             await message.answer(
@@ -456,7 +730,7 @@ async def process_product_price(message: Message, state: FSMContext):
 
 # --- Ввод веса ---
 @router.message(AdminStates.adding_product_weight)
-async def process_product_weight(message: Message, state: FSMContext):
+async def process_product_weight(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода веса товара"""
     if message.text.strip().lower() == 'отмена':
         await message.answer(
@@ -473,8 +747,8 @@ async def process_product_weight(message: Message, state: FSMContext):
         # Показываем сводку данных перед сохранением
         data = await state.get_data()
 
-        shop = await database.get_shop_by_id(data['shop_id'])
-        category = await database.get_category_by_id(data['category_id'])
+        shop = await database.get_shop_by_id(data['shop_id'], session=session)
+        category = await database.get_category_by_id(data['category_id'], session=session)
 
         summary_text = (
             "📋 <b>Проверьте данные товара:</b>\n\n"
@@ -500,19 +774,19 @@ async def process_product_weight(message: Message, state: FSMContext):
 
 # --- Ввод фото ---
 @router.message(AdminStates.adding_product_photo, F.photo)
-async def process_product_photo(message: Message, state: FSMContext):
+async def process_product_photo(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка фото товара"""
     photo_file_id = message.photo[-1].file_id
     await state.update_data(product_photo_file_id=photo_file_id)
-    await save_product(message, state)
+    await save_product(message, state, session)
 
 
 @router.message(AdminStates.adding_product_photo, F.text)
-async def process_product_no_photo(message: Message, state: FSMContext):
+async def process_product_no_photo(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка пропуска фото"""
     if message.text.strip().lower() == 'пропустить':
         await state.update_data(product_photo_file_id=None)
-        await save_product(message, state)
+        await save_product(message, state, session)
     elif message.text.strip().lower() == 'отмена':
         await message.answer(
             "❌ Добавление товара отменено.",
@@ -527,7 +801,7 @@ async def process_product_no_photo(message: Message, state: FSMContext):
 
 
 # --- Сохранение товара ---
-async def save_product(message: Message, state: FSMContext):
+async def save_product(message: Message, state: FSMContext, session: AsyncSession):
     """Сохранение товара в базу данных"""
     data = await state.get_data()
 
@@ -540,7 +814,8 @@ async def save_product(message: Message, state: FSMContext):
             price_original=data['product_price'],
             currency=data['product_currency'],
             weight=data.get('product_weight'),
-            photo_file_id=data.get('product_photo_file_id')
+            photo_file_id=data.get('product_photo_file_id'),
+            session=session
         )
 
         await message.answer(
@@ -586,50 +861,21 @@ async def cancel_operation(callback: CallbackQuery, state: FSMContext):
 
 # --- Просмотр деталей заказа админом ---
 @router.callback_query(F.data.startswith("admin_order_"))
-async def show_admin_order_details(callback: CallbackQuery):
+async def show_admin_order_details(callback: CallbackQuery, session: AsyncSession):
     """Показать детали заказа для админа"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
         return
 
     order_id = int(callback.data.split("_")[2])
-    order = await database.get_order_by_id(order_id)
+    order = await database.get_order_detail(order_id, session=session)
 
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
         return
 
-    # Получаем клиента
-    client = await database.get_client_by_id(order.client_id)
-
-    # Получаем товары заказа
-    order_items = await database.get_order_items(order.id)
-
-    # Формируем текст
-    text = (
-        f"📦 <b>Заказ #{order.tracking_number}</b>\n\n"
-        f"👤 Клиент: {client.name}\n"
-        f"📱 Телефон: {client.phone}\n"
-        f"🆔 Telegram: <a href='tg://user?id={client.telegram_id}'>@{client.telegram_id}</a>\n"
-        f"📍 Адрес: {client.address}\n\n"
-        f"📅 Дата заказа: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
-        f"📊 Статус: {order.status}\n"
-        f"🚚 Тип доставки: {order.delivery_type}\n\n"
-        "<b>Товары:</b>\n"
-    )
-
-    for order_item, product in order_items:
-        text += f"• {product.name} x{order_item.quantity} - {format_price(order_item.price_rub * order_item.quantity)} ₽\n"
-
-    text += (
-        f"\n💰 Стоимость товаров: {format_price(order.total_amount - order.delivery_cost - order.customs_fee)} ₽\n"
-        f"📦 Доставка: {format_price(order.delivery_cost)} ₽\n"
-        f"🛃 Таможенный сбор: {format_price(order.customs_fee)} ₽\n\n"
-        f"<b>💵 Итого: {format_price(order.total_amount)} ₽</b>"
-    )
-
     await callback.message.edit_text(
-        text,
+        format_order_details(order, with_client=True),
         reply_markup=get_admin_order_keyboard(order.id),
         disable_web_page_preview=True
     )
@@ -655,7 +901,7 @@ async def change_order_status(callback: CallbackQuery):
 
 # --- Установка статуса ---
 @router.callback_query(F.data.startswith("set_status_"))
-async def set_order_status(callback: CallbackQuery):
+async def set_order_status(callback: CallbackQuery, session: AsyncSession):
     """Установить новый статус заказа"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ У вас нет прав доступа.", show_alert=True)
@@ -665,19 +911,18 @@ async def set_order_status(callback: CallbackQuery):
     order_id = int(parts[2])
     new_status = parts[3]
 
-    order = await database.get_order_by_id(order_id)
+    order = await database.get_order_detail(order_id, session=session)
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
         return
 
-    # Обновляем статус
-    await database.update_order_status(order_id, new_status)
+    # Обновляем статус (загруженный заказ обновляется вместе с базой)
+    await database.update_order_status(order_id, new_status, session=session)
 
     # Уведомляем клиента
-    client = await database.get_client_by_id(order.client_id)
     try:
         await callback.bot.send_message(
-            client.telegram_id,
+            order.client.telegram_id,
             f"📦 <b>Обновление статуса заказа</b>\n\n"
             f"Заказ #{order.tracking_number}\n"
             f"Новый статус: {new_status}"
@@ -687,35 +932,8 @@ async def set_order_status(callback: CallbackQuery):
 
     await callback.answer(f"✅ Статус изменен на: {new_status}")
 
-    # Обновляем информацию о заказе
-    order = await database.get_order_by_id(order_id)
-    client = await database.get_client_by_id(order.client_id)
-    order_items = await database.get_order_items(order.id)
-
-    text = (
-        f"📦 <b>Заказ #{order.tracking_number}</b>\n\n"
-        f"👤 Клиент: {client.name}\n"
-        f"📱 Телефон: {client.phone}\n"
-        f"🆔 Telegram: <a href='tg://user?id={client.telegram_id}'>@{client.telegram_id}</a>\n"
-        f"📍 Адрес: {client.address}\n\n"
-        f"📅 Дата заказа: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
-        f"📊 Статус: {order.status}\n"
-        f"🚚 Тип доставки: {order.delivery_type}\n\n"
-        "<b>Товары:</b>\n"
-    )
-
-    for order_item, product in order_items:
-        text += f"• {product.name} x{order_item.quantity} - {format_price(order_item.price_rub * order_item.quantity)} ₽\n"
-
-    text += (
-        f"\n💰 Стоимость товаров: {format_price(order.total_amount - order.delivery_cost - order.customs_fee)} ₽\n"
-        f"📦 Доставка: {format_price(order.delivery_cost)} ₽\n"
-        f"🛃 Таможенный сбор: {format_price(order.customs_fee)} ₽\n\n"
-        f"<b>💵 Итого: {format_price(order.total_amount)} ₽</b>"
-    )
-
     await callback.message.edit_text(
-        text,
+        format_order_details(order, with_client=True),
         reply_markup=get_admin_order_keyboard(order.id),
         disable_web_page_preview=True
     )
@@ -723,18 +941,19 @@ async def set_order_status(callback: CallbackQuery):
 
 # --- Управление курсами валют ---
 @router.message(F.text == "💱 Курсы валют")
-async def manage_exchange_rates(message: Message, state: FSMContext):
+async def manage_exchange_rates(message: Message, state: FSMContext, session: AsyncSession):
     """Управление курсами валют"""
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("❌ У вас нет прав доступа.")
         return
 
     # Показываем текущие курсы
+    exchange_rates = await database.get_rates(session=session)
     text = "💱 <b>Текущие курсы валют:</b>\n\n"
     for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
+        rate = exchange_rates.get(currency)
         if rate:
-            text += f"{currency}: {rate.rate_to_rub} ₽\n"
+            text += f"{currency}: {rate} ₽\n"
         else:
             text += f"{currency}: не установлен\n"
 
@@ -760,14 +979,14 @@ async def process_exchange_rate_currency(message: Message, state: FSMContext):
 
 # --- Ввод курса ---
 @router.message(AdminStates.setting_exchange_rate_value)
-async def process_exchange_rate_value(message: Message, state: FSMContext):
+async def process_exchange_rate_value(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода курса"""
     try:
         rate = float(message.text.strip())
         data = await state.get_data()
         currency = data['exchange_currency']
 
-        await database.set_exchange_rate(currency, rate)
+        await database.set_exchange_rate(currency, rate, session=session)
 
         await message.answer(
             f"✅ Курс {currency} установлен: {rate} ₽",
@@ -801,7 +1020,7 @@ async def broadcast_menu(message: Message, state: FSMContext):
 
 # --- Обработка сообщения для рассылки ---
 @router.message(AdminStates.broadcast_message, F.text | F.photo | F.document)
-async def process_broadcast_message(message: Message, state: FSMContext):
+async def process_broadcast_message(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка сообщения для рассылки"""
     if message.text and message.text.strip().lower() == 'отмена':
         await message.answer(
@@ -835,8 +1054,7 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     await state.update_data(broadcast_data=broadcast_data)
 
     # Получаем количество пользователей
-    clients = await database.get_all_clients()
-    user_count = len(clients)
+    user_count = await database.count_clients(session=session)
 
     # Показываем предпросмотр и запрашиваем подтверждение
     preview_text = "📢 <b>Предпросмотр рассылки:</b>\n\n"
@@ -888,14 +1106,19 @@ async def process_broadcast_message(message: Message, state: FSMContext):
 
 # --- Подтверждение рассылки ---
 @router.callback_query(AdminStates.broadcast_confirmation, F.data == "confirm_broadcast")
-async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Подтверждение и запуск рассылки"""
     data = await state.get_data()
     broadcast_data = data['broadcast_data']
 
-    # Получаем всех клиентов
-    clients = await database.get_all_clients()
-    total_users = len(clients)
+    # Ключ идемпотентности - сообщение с предпросмотром: повторное нажатие
+    # на подтверждение не ставит рассылку в очередь второй раз
+    idempotency_key = f"{callback.message.chat.id}:{callback.message.message_id}"
+    if await database.get_broadcast_job_by_key(idempotency_key, session=session):
+        await callback.answer("✅ Рассылка уже запущена")
+        return
+
+    total_users = await database.count_clients(session=session)
 
     if total_users == 0:
         await callback.message.edit_text(
@@ -907,65 +1130,26 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
 
     # Отправляем сообщение о начале рассылки
     progress_message = await callback.message.answer(
-        f"📢 <b>Начата рассылка</b>\n\n"
-        f"👥 Всего пользователей: {total_users}\n"
-        f"✅ Отправлено: 0/{total_users}\n"
-        f"❌ Ошибок: 0\n\n"
-        f"⏳ Ожидайте завершения..."
+        f"📢 <b>Рассылка поставлена в очередь</b>\n\n"
+        f"👥 Всего пользователей: {total_users}\n\n"
+        f"⏳ Рассылка идет в фоне, прогресс будет обновляться здесь."
     )
 
-    success_count = 0
-    error_count = 0
-
-    # Рассылаем сообщение
-    for i, client in enumerate(clients, 1):
-        try:
-            if broadcast_data['message_type'] == 'text':
-                await callback.bot.send_message(
-                    chat_id=client.telegram_id,
-                    text=broadcast_data['content']
-                )
-            elif broadcast_data['message_type'] == 'photo':
-                await callback.bot.send_photo(
-                    chat_id=client.telegram_id,
-                    photo=broadcast_data['file_id'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_data['message_type'] == 'document':
-                await callback.bot.send_document(
-                    chat_id=client.telegram_id,
-                    document=broadcast_data['file_id'],
-                    caption=broadcast_data.get('caption')
-                )
-
-            success_count += 1
-
-            # Обновляем прогресс каждые 10 сообщений или для последнего сообщения
-            if i % 10 == 0 or i == total_users:
-                await progress_message.edit_text(
-                    f"📢 <b>Рассылка в процессе</b>\n\n"
-                    f"👥 Всего пользователей: {total_users}\n"
-                    f"✅ Отправлено: {i}/{total_users}\n"
-                    f"❌ Ошибок: {error_count}\n\n"
-                    f"⏳ Прогресс: {i / total_users * 100:.1f}%"
-                )
-
-        except Exception as e:
-            error_count += 1
-            continue
-
-        # Небольшая задержка чтобы не превысить лимиты Telegram
-        import asyncio
-        await asyncio.sleep(0.1)
-
-    # Финальное сообщение о результатах
-    await progress_message.edit_text(
-        f"📢 <b>Рассылка завершена!</b>\n\n"
-        f"👥 Всего пользователей: {total_users}\n"
-        f"✅ Успешно отправлено: {success_count}\n"
-        f"❌ Ошибок: {error_count}\n"
-        f"📊 Эффективность: {success_count / total_users * 100:.1f}%"
+    # Задание сохраняется своей сессией: оно должно быть в базе до пробуждения воркера
+    _, created = await database.create_broadcast_job(
+        admin_chat_id=callback.from_user.id,
+        payload=broadcast_data,
+        total=total_users,
+        progress_message_id=progress_message.message_id,
+        idempotency_key=idempotency_key
     )
+    if not created:
+        # Параллельное нажатие успело создать задание раньше
+        with suppress(TelegramBadRequest):
+            await progress_message.delete()
+        await callback.answer("✅ Рассылка уже запущена")
+        return
+    broadcast_service.wake()
 
     await callback.message.answer(
         "🔑 <b>Админ-панель</b>\n\n"
@@ -1023,18 +1207,8 @@ async def back_to_admin(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "back_to_admin_orders")
-async def back_to_admin_orders(callback: CallbackQuery):
+async def back_to_admin_orders(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Возврат к списку заказов"""
-    orders = await database.get_all_orders()
-
-    if not orders:
-        await callback.message.edit_text("📦 Заказов пока нет.")
-        await callback.answer()
-        return
-
-    await callback.message.edit_text(
-        f"📊 <b>Все заказы ({len(orders)}):</b>\n\n"
-        "Выберите заказ для просмотра и управления:",
-        reply_markup=get_admin_orders_keyboard(orders)
-    )
+    text, keyboard = await render_admin_orders_page(await get_order_filters(state), session)
+    await callback.message.edit_text(text, reply_markup=keyboard)
     await callback.answer()
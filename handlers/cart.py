@@ -1,11 +1,15 @@
 # --- Импорты ---
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import database
-from config import DELIVERY_TYPES, CUSTOMS_FEE_PERCENT
-from utils import convert_to_rub, format_price
+from cache import ClientSnapshot
+from config import DELIVERY_TYPES
+from utils import convert_to_rub, format_price, snapshot_cart_items, calculate_order_totals
 from keyboards import (
     get_cart_keyboard,
     get_delivery_keyboard,
@@ -19,15 +23,14 @@ router = Router()
 
 # --- Просмотр корзины ---
 @router.message(F.text == "🛒 Корзина")
-async def show_cart(message: Message):
+async def show_cart(message: Message, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Показать корзину"""
-    client = await database.get_client_by_telegram_id(message.from_user.id)
     
     if not client:
         await message.answer("Пожалуйста, сначала зарегистрируйтесь через /start")
         return
     
-    cart_items = await database.get_cart_items(client.id)
+    cart_items = await database.get_cart_items(client.id, session=session)
     
     if not cart_items:
         await message.answer(
@@ -37,11 +40,7 @@ async def show_cart(message: Message):
         return
     
     # Получаем курсы валют
-    exchange_rates = {}
-    for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
-        if rate:
-            exchange_rates[currency] = rate.rate_to_rub
+    exchange_rates = await database.get_rates(session=session)
     
     # Формируем текст корзины
     text = "🛒 <b>Ваша корзина:</b>\n\n"
@@ -69,20 +68,19 @@ async def show_cart(message: Message):
 
 # --- Удаление из корзины ---
 @router.callback_query(F.data.startswith("remove_from_cart_"))
-async def remove_from_cart(callback: CallbackQuery):
+async def remove_from_cart(callback: CallbackQuery, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Удаление товара из корзины"""
     product_id = int(callback.data.split("_")[3])
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
     
     if not client:
         await callback.answer("Ошибка: клиент не найден", show_alert=True)
         return
     
-    product = await database.get_product_by_id(product_id)
-    await database.remove_from_cart(client.id, product_id)
+    product = await database.get_product_by_id(product_id, session=session)
+    await database.remove_from_cart(client.id, product_id, session=session)
     
     # Обновляем корзину
-    cart_items = await database.get_cart_items(client.id)
+    cart_items = await database.get_cart_items(client.id, session=session)
     
     if not cart_items:
         await callback.message.edit_text(
@@ -93,11 +91,7 @@ async def remove_from_cart(callback: CallbackQuery):
         return
     
     # Получаем курсы валют
-    exchange_rates = {}
-    for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
-        if rate:
-            exchange_rates[currency] = rate.rate_to_rub
+    exchange_rates = await database.get_rates(session=session)
     
     # Формируем обновленный текст корзины
     text = "🛒 <b>Ваша корзина:</b>\n\n"
@@ -126,15 +120,14 @@ async def remove_from_cart(callback: CallbackQuery):
 
 # --- Очистка корзины ---
 @router.callback_query(F.data == "clear_cart")
-async def clear_cart(callback: CallbackQuery):
+async def clear_cart(callback: CallbackQuery, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Очистка корзины"""
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
     
     if not client:
         await callback.answer("Ошибка: клиент не найден", show_alert=True)
         return
     
-    await database.clear_cart(client.id)
+    await database.clear_cart(client.id, session=session)
     
     await callback.message.edit_text(
         "🛒 Корзина очищена!\n\n"
@@ -145,22 +138,21 @@ async def clear_cart(callback: CallbackQuery):
 
 # --- Оформление заказа ---
 @router.callback_query(F.data == "checkout")
-async def checkout(callback: CallbackQuery, state: FSMContext):
+async def checkout(callback: CallbackQuery, state: FSMContext, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Начало оформления заказа"""
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
     
     if not client:
         await callback.answer("Ошибка: клиент не найден", show_alert=True)
         return
     
-    cart_items = await database.get_cart_items(client.id)
+    cart_items = await database.get_cart_items(client.id, session=session)
     
     if not cart_items:
         await callback.answer("Корзина пуста!", show_alert=True)
         return
     
-    # Сохраняем корзину в состояние
-    await state.update_data(cart_items=cart_items)
+    # Сохраняем снимок корзины в состояние (только примитивы)
+    await state.update_data(checkout_items=snapshot_cart_items(cart_items))
     
     await callback.message.edit_text(
         "📦 <b>Выберите тип доставки:</b>\n\n"
@@ -174,50 +166,26 @@ async def checkout(callback: CallbackQuery, state: FSMContext):
 
 # --- Выбор доставки ---
 @router.callback_query(F.data.startswith("delivery_"))
-async def select_delivery(callback: CallbackQuery, state: FSMContext):
+async def select_delivery(callback: CallbackQuery, state: FSMContext, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Выбор типа доставки"""
     delivery_type = callback.data.split("_")[1]
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
     
     data = await state.get_data()
-    cart_items = data.get("cart_items", [])
+    checkout_items = data.get("checkout_items", [])
     
-    if not cart_items:
+    if not checkout_items:
         await callback.answer("Корзина пуста!", show_alert=True)
         return
     
     # Получаем курсы валют
-    exchange_rates = {}
-    for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
-        if rate:
-            exchange_rates[currency] = rate.rate_to_rub
-    
-    # Рассчитываем стоимость
-    subtotal = 0.0
-    for cart_item, product in cart_items:
-        price_rub = await convert_to_rub(product.price_original, product.currency, exchange_rates)
-        subtotal += price_rub * cart_item.quantity
-    
-    # Базовая доставка (средняя по странам)
-    base_delivery = 1000.0
-    delivery_multiplier = DELIVERY_TYPES[delivery_type]['multiplier']
-    delivery_cost = base_delivery * delivery_multiplier
+    exchange_rates = await database.get_rates(session=session)
     
-    # Таможенный сбор
-    customs_fee = subtotal * CUSTOMS_FEE_PERCENT
-    
-    # Итого
-    total = subtotal + delivery_cost + customs_fee
-    
-    # Сохраняем данные заказа
-    await state.update_data(
-        delivery_type=delivery_type,
-        subtotal=subtotal,
-        delivery_cost=delivery_cost,
-        customs_fee=customs_fee,
-        total=total
-    )
+    # Рассчитываем стоимость (при подтверждении заказ пересчитывается по корзине в базе)
+    totals = await calculate_order_totals(checkout_items, exchange_rates, delivery_type)
+    subtotal = totals['subtotal']
+    delivery_cost = totals['delivery_cost']
+    customs_fee = totals['customs_fee']
+    total = totals['total']
     
     # Формируем текст подтверждения
     text = (
@@ -228,9 +196,9 @@ async def select_delivery(callback: CallbackQuery, state: FSMContext):
         "<b>Товары:</b>\n"
     )
     
-    for cart_item, product in cart_items:
-        price_rub = await convert_to_rub(product.price_original, product.currency, exchange_rates)
-        text += f"• {product.name} x{cart_item.quantity} - {format_price(price_rub * cart_item.quantity)} ₽\n"
+    for item in checkout_items:
+        price_rub = await convert_to_rub(item['price_original'], item['currency'], exchange_rates)
+        text += f"• {item['name']} x{item['quantity']} - {format_price(price_rub * item['quantity'])} ₽\n"
     
     text += (
         f"\n💰 Стоимость товаров: {format_price(subtotal)} ₽\n"
@@ -243,40 +211,40 @@ async def select_delivery(callback: CallbackQuery, state: FSMContext):
     
     await callback.message.edit_text(
         text,
-        reply_markup=get_order_confirmation_keyboard()
+        reply_markup=get_order_confirmation_keyboard(delivery_type)
     )
     await callback.answer()
 
 
 # --- Подтверждение заказа ---
-@router.callback_query(F.data == "confirm_order")
-async def confirm_order(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(F.data.startswith("confirm_order_"))
+async def confirm_order(callback: CallbackQuery, state: FSMContext, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Подтверждение и создание заказа"""
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
+    delivery_type = callback.data.split("_", 2)[2]
     
-    data = await state.get_data()
-    cart_items = data.get("cart_items", [])
-    delivery_type = data.get("delivery_type")
-    total = data.get("total")
-    delivery_cost = data.get("delivery_cost")
-    customs_fee = data.get("customs_fee")
-    
-    if not cart_items or not delivery_type:
+    if not client or delivery_type not in DELIVERY_TYPES:
         await callback.answer("Ошибка при оформлении заказа", show_alert=True)
         return
     
-    # Создаем заказ
-    order = await database.create_order(
+    # Ключ идемпотентности - сообщение с подтверждением: повторное нажатие
+    # и повторная доставка апдейта не создадут второй заказ
+    idempotency_key = f"{callback.message.chat.id}:{callback.message.message_id}"
+    
+    # Создаем заказ и очищаем корзину одной транзакцией
+    order, created = await database.checkout(
         client_id=client.id,
-        total_amount=total,
-        delivery_cost=delivery_cost,
-        customs_fee=customs_fee,
         delivery_type=delivery_type,
-        cart_items=cart_items
+        idempotency_key=idempotency_key,
+        session=session
     )
     
-    # Очищаем корзину
-    await database.clear_cart(client.id)
+    if order is None:
+        await callback.answer("Корзина пуста!", show_alert=True)
+        return
+    
+    if not created:
+        await callback.answer("✅ Заказ уже оформлен")
+        return
     
     # Очищаем состояние
     await state.clear()
@@ -284,7 +252,7 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         f"✅ <b>Заказ успешно оформлен!</b>\n\n"
         f"📦 Номер отслеживания: <code>{order.tracking_number}</code>\n"
-        f"💰 Сумма: {format_price(total)} ₽\n"
+        f"💰 Сумма: {format_price(order.total_amount)} ₽\n"
         f"📅 Дата заказа: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
         f"🚚 Тип доставки: {delivery_type}\n"
         f"📊 Статус: {order.status}\n\n"
@@ -307,10 +275,9 @@ async def cancel_checkout(callback: CallbackQuery, state: FSMContext):
 
 # --- Возврат в корзину ---
 @router.callback_query(F.data == "back_to_cart")
-async def back_to_cart(callback: CallbackQuery, state: FSMContext):
+async def back_to_cart(callback: CallbackQuery, state: FSMContext, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Возврат в корзину"""
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
-    cart_items = await database.get_cart_items(client.id)
+    cart_items = await database.get_cart_items(client.id, session=session)
     
     if not cart_items:
         await callback.message.edit_text(
@@ -321,11 +288,7 @@ async def back_to_cart(callback: CallbackQuery, state: FSMContext):
         return
     
     # Получаем курсы валют
-    exchange_rates = {}
-    for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
-        if rate:
-            exchange_rates[currency] = rate.rate_to_rub
+    exchange_rates = await database.get_rates(session=session)
     
     # Формируем текст корзины
     text = "🛒 <b>Ваша корзина:</b>\n\n"
@@ -1,10 +1,14 @@
 # --- Импорты ---
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import database
-from utils import convert_to_rub, format_price
+from cache import ClientSnapshot
+from utils import convert_to_rub, format_price, page_flags
 from keyboards import (
     get_countries_keyboard,
     get_shops_keyboard,
@@ -17,18 +21,20 @@ from keyboards import (
 # --- Инициализация роутера ---
 router = Router()
 
+# --- Количество товаров на одной странице каталога ---
+PRODUCTS_PAGE_SIZE = 5
+
 
 # --- Просмотр каталога ---
 @router.message(F.text == "🛍️ Каталог товаров")
-async def show_catalog(message: Message):
+async def show_catalog(message: Message, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Показать каталог стран"""
-    client = await database.get_client_by_telegram_id(message.from_user.id)
     
     if not client:
         await message.answer("Пожалуйста, сначала зарегистрируйтесь через /start")
         return
     
-    countries = await database.get_all_countries()
+    countries = await database.get_all_countries(session=session)
     
     if not countries:
         await message.answer(
@@ -45,16 +51,16 @@ async def show_catalog(message: Message):
 
 # --- Обработка выбора страны ---
 @router.callback_query(F.data.startswith("country_"))
-async def process_country_selection(callback: CallbackQuery):
+async def process_country_selection(callback: CallbackQuery, session: AsyncSession):
     """Обработка выбора страны"""
     country_id = int(callback.data.split("_")[1])
-    country = await database.get_country_by_id(country_id)
+    country = await database.get_country_by_id(country_id, session=session)
     
     if not country:
         await callback.answer("Страна не найдена", show_alert=True)
         return
     
-    shops = await database.get_shops_by_country(country_id)
+    shops = await database.get_shops_by_country(country_id, session=session)
     
     if not shops:
         await callback.answer(
@@ -75,10 +81,10 @@ async def process_country_selection(callback: CallbackQuery):
 
 # --- Обработка выбора магазина ---
 @router.callback_query(F.data.startswith("shop_"))
-async def process_shop_selection(callback: CallbackQuery, state: FSMContext):
+async def process_shop_selection(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Обработка выбора магазина"""
     shop_id = int(callback.data.split("_")[1])
-    shop = await database.get_shop_by_id(shop_id)
+    shop = await database.get_shop_by_id(shop_id, session=session)
     
     if not shop:
         await callback.answer("Магазин не найден", show_alert=True)
@@ -95,70 +101,112 @@ async def process_shop_selection(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# --- Вывод списка товаров ---
+async def show_products_page(
+    callback: CallbackQuery,
+    shop_id: int,
+    category_id: int,
+    session: AsyncSession,
+    page: int = 0,
+    direction: str = None,
+    cursor: int = None
+) -> bool:
+    """Показать страницу товаров магазина в категории.
+
+    Без курсора показывается первая страница; direction 'n' листает вперед
+    от cursor, 'p' - назад. Возвращает False, если товаров нет.
+    """
+    products, has_more = await database.get_products_page(
+        shop_id,
+        category_id,
+        limit=PRODUCTS_PAGE_SIZE,
+        after_id=cursor if direction == 'n' else None,
+        before_id=cursor if direction == 'p' else None,
+        session=session
+    )
+    if not products:
+        return False
+
+    has_prev, has_next = page_flags(direction, has_more)
+
+    category = await database.get_category_by_id(category_id, session=session)
+
+    # Получаем курсы валют
+    exchange_rates = await database.get_rates(session=session)
+
+    title = f"📦 <b>{category.name}</b>"
+    if page:
+        title += f" (стр. {page + 1})"
+
+    text = f"{title}\n\n"
+    for product in products:
+        price_rub = await convert_to_rub(product.price_original, product.currency, exchange_rates)
+        text += (
+            f"🛍️ <b>{product.name}</b>\n"
+            f"💰 {product.price_original} {product.currency} (≈{format_price(price_rub)} ₽)\n"
+            f"📝 {product.description[:100]}...\n\n"
+        )
+
+    await callback.message.edit_text(
+        text,
+        reply_markup=get_products_keyboard(
+            products, shop_id, category_id, page=page, has_prev=has_prev, has_next=has_next
+        )
+    )
+    return True
+
+
 # --- Обработка выбора категории ---
 @router.callback_query(F.data.startswith("category_"))
-async def process_category_selection(callback: CallbackQuery, state: FSMContext):
+async def process_category_selection(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Обработка выбора категории"""
     parts = callback.data.split("_")
     category_id = int(parts[1])
     shop_id = int(parts[3])
     
-    category = await database.get_category_by_id(category_id)
-    products = await database.get_products_by_category(category_id)
-    
-    # Фильтруем товары по магазину
-    products = [p for p in products if p.shop_id == shop_id]
-    
-    if not products:
+    if not await show_products_page(callback, shop_id, category_id, session):
         await callback.answer(
             "В этой категории пока нет товаров",
             show_alert=True
         )
         return
     
-    await state.update_data(current_category_id=category_id, current_products=products)
-    
-    # Получаем курсы валют
-    exchange_rates = {}
-    for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-        rate = await database.get_exchange_rate(currency)
-        if rate:
-            exchange_rates[currency] = rate.rate_to_rub
-    
-    # Показываем первые 5 товаров
-    products_page = products[:5]
-    
-    text = f"📦 <b>{category.name}</b>\n\n"
-    for product in products_page:
-        price_rub = await convert_to_rub(product.price_original, product.currency, exchange_rates)
-        text += (
-            f"🛍️ <b>{product.name}</b>\n"
-            f"💰 {product.price_original} {product.currency} (≈{format_price(price_rub)} ₽)\n"
-            f"📝 {product.description[:100]}...\n\n"
-        )
+    await state.update_data(current_shop_id=shop_id, current_category_id=category_id)
+    await callback.answer()
+
+
+# --- Листание списка товаров ---
+@router.callback_query(F.data.startswith("page_"))
+async def process_products_page(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Переход на соседнюю страницу товаров"""
+    _, shop_id, category_id, page, direction, cursor = callback.data.split("_")
+    shop_id, category_id = int(shop_id), int(category_id)
+    
+    if not await show_products_page(
+        callback, shop_id, category_id, session,
+        page=int(page), direction=direction, cursor=int(cursor)
+    ):
+        await callback.answer("Больше товаров нет", show_alert=True)
+        return
     
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_products_keyboard(products_page, page=0, total_pages=(len(products) + 4) // 5)
-    )
+    await state.update_data(current_shop_id=shop_id, current_category_id=category_id)
     await callback.answer()
 
 
 # --- Обработка выбора товара ---
 @router.callback_query(F.data.startswith("product_"))
-async def process_product_selection(callback: CallbackQuery):
+async def process_product_selection(callback: CallbackQuery, session: AsyncSession):
     """Обработка выбора товара"""
     product_id = int(callback.data.split("_")[1])
-    product = await database.get_product_by_id(product_id)
+    product = await database.get_product_by_id(product_id, session=session)
     
     if not product:
         await callback.answer("Товар не найден", show_alert=True)
         return
     
     # Получаем курс валюты
-    rate = await database.get_exchange_rate(product.currency)
-    exchange_rate = rate.rate_to_rub if rate else 1.0
-    price_rub = product.price_original * exchange_rate
+    exchange_rates = await database.get_rates(session=session)
+    price_rub = product.price_original * exchange_rates.get(product.currency, 1.0)
     
     text = (
         f"🛍️ <b>{product.name}</b>\n\n"
@@ -189,21 +237,22 @@ async def process_product_selection(callback: CallbackQuery):
 
 # --- Добавление в корзину ---
 @router.callback_query(F.data.startswith("add_to_cart_"))
-async def add_to_cart(callback: CallbackQuery):
+async def add_to_cart(callback: CallbackQuery, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Добавление товара в корзину"""
     product_id = int(callback.data.split("_")[3])
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
     
     if not client:
         await callback.answer("Ошибка: клиент не найден", show_alert=True)
         return
     
-    product = await database.get_product_by_id(product_id)
+    product = await database.get_product_by_id(product_id, session=session)
     if not product:
         await callback.answer("Товар не найден", show_alert=True)
         return
     
-    await database.add_to_cart(client.id, product_id, quantity=1)
+    if not await database.add_to_cart(client.id, product_id, quantity=1, session=session):
+        await callback.answer("Товар недоступен", show_alert=True)
+        return
     
     await callback.answer(
         f"✅ Товар '{product.name}' добавлен в корзину!",
@@ -213,9 +262,9 @@ async def add_to_cart(callback: CallbackQuery):
 
 # --- Навигация назад ---
 @router.callback_query(F.data == "back_to_countries")
-async def back_to_countries(callback: CallbackQuery):
+async def back_to_countries(callback: CallbackQuery, session: AsyncSession):
     """Возврат к списку стран"""
-    countries = await database.get_all_countries()
+    countries = await database.get_all_countries(session=session)
     await callback.message.edit_text(
         "🌍 <b>Выберите страну:</b>\n\n"
         "Доступные страны для заказа товаров:",
@@ -225,16 +274,16 @@ async def back_to_countries(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "back_to_shops")
-async def back_to_shops(callback: CallbackQuery, state: FSMContext):
+async def back_to_shops(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Возврат к списку магазинов"""
     data = await state.get_data()
     shop_id = data.get("current_shop_id")
     
     if shop_id:
-        shop = await database.get_shop_by_id(shop_id)
+        shop = await database.get_shop_by_id(shop_id, session=session)
         if shop:
-            shops = await database.get_shops_by_country(shop.country_id)
-            country = await database.get_country_by_id(shop.country_id)
+            shops = await database.get_shops_by_country(shop.country_id, session=session)
+            country = await database.get_country_by_id(shop.country_id, session=session)
             
             await callback.message.edit_text(
                 f"{country.flag_emoji} <b>{country.name}</b>\n\n"
@@ -246,13 +295,13 @@ async def back_to_shops(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "back_to_categories")
-async def back_to_categories(callback: CallbackQuery, state: FSMContext):
+async def back_to_categories(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Возврат к категориям"""
     data = await state.get_data()
     shop_id = data.get("current_shop_id")
     
     if shop_id:
-        shop = await database.get_shop_by_id(shop_id)
+        shop = await database.get_shop_by_id(shop_id, session=session)
         await callback.message.edit_text(
             f"🏪 <b>{shop.name}</b>\n\n"
             "Выберите категорию товаров:",
@@ -263,37 +312,14 @@ async def back_to_categories(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "back_to_products")
-async def back_to_products(callback: CallbackQuery, state: FSMContext):
+async def back_to_products(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Возврат к списку товаров"""
     data = await state.get_data()
+    shop_id = data.get("current_shop_id")
     category_id = data.get("current_category_id")
-    products = data.get("current_products", [])
     
-    if category_id and products:
-        category = await database.get_category_by_id(category_id)
-        
-        # Получаем курсы валют
-        exchange_rates = {}
-        for currency in ['USD', 'EUR', 'CNY', 'JPY']:
-            rate = await database.get_exchange_rate(currency)
-            if rate:
-                exchange_rates[currency] = rate.rate_to_rub
-        
-        products_page = products[:5]
-        
-        text = f"📦 <b>{category.name}</b>\n\n"
-        for product in products_page:
-            price_rub = await convert_to_rub(product.price_original, product.currency, exchange_rates)
-            text += (
-                f"🛍️ <b>{product.name}</b>\n"
-                f"💰 {product.price_original} {product.currency} (≈{format_price(price_rub)} ₽)\n"
-                f"📝 {product.description[:100]}...\n\n"
-            )
-        
-        await callback.message.edit_text(
-            text,
-            reply_markup=get_products_keyboard(products_page, page=0, total_pages=(len(products) + 4) // 5)
-        )
+    if shop_id and category_id:
+        await show_products_page(callback, shop_id, category_id, session)
     
     await callback.answer()
 
@@ -1,10 +1,16 @@
 # --- Импорты ---
+from datetime import datetime
+from typing import Optional, Tuple
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import database
-from utils import format_price
+from cache import ClientSnapshot
+from utils import format_order_details, page_flags
 from keyboards import (
+    ORDER_CURSOR_FORMAT,
     get_orders_keyboard,
     get_order_keyboard
 )
@@ -13,71 +19,104 @@ from keyboards import (
 # --- Инициализация роутера ---
 router = Router()
 
+# Заказов на одной странице истории
+ORDERS_PAGE_SIZE = 10
+
+NO_ORDERS_TEXT = (
+    "📦 У вас пока нет заказов.\n\n"
+    "Перейдите в каталог товаров, чтобы сделать первый заказ!"
+)
+
+
+# --- Страница истории заказов ---
+async def render_orders_page(
+    client_id: int,
+    session: AsyncSession,
+    page: int = 0,
+    direction: str = None,
+    cursor: Tuple[datetime, int] = None
+) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Текст и клавиатура страницы заказов клиента.
+
+    Без курсора строится первая страница; direction 'n' листает вперед
+    от cursor, 'p' - назад. Возвращает None, если заказов нет.
+    """
+    orders, has_more = await database.get_orders_page(
+        limit=ORDERS_PAGE_SIZE,
+        after=cursor if direction == 'n' else None,
+        before=cursor if direction == 'p' else None,
+        client_id=client_id,
+        session=session
+    )
+    if not orders:
+        return None
+
+    has_prev, has_next = page_flags(direction, has_more)
+
+    total = await database.count_orders(client_id=client_id, session=session)
+    title = f"📦 <b>Ваши заказы ({total})"
+    if page:
+        title += f", стр. {page + 1}"
+    title += ":</b>"
+
+    text = f"{title}\n\nВыберите заказ для просмотра деталей:"
+    return text, get_orders_keyboard(orders, page=page, has_prev=has_prev, has_next=has_next)
+
 
 # --- Просмотр заказов ---
 @router.message(F.text == "📦 Мои заказы")
-async def show_orders(message: Message):
+async def show_orders(message: Message, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Показать список заказов"""
-    client = await database.get_client_by_telegram_id(message.from_user.id)
     
     if not client:
         await message.answer("Пожалуйста, сначала зарегистрируйтесь через /start")
         return
     
-    orders = await database.get_client_orders(client.id)
+    orders_page = await render_orders_page(client.id, session)
     
-    if not orders:
-        await message.answer(
-            "📦 У вас пока нет заказов.\n\n"
-            "Перейдите в каталог товаров, чтобы сделать первый заказ!"
-        )
+    if not orders_page:
+        await message.answer(NO_ORDERS_TEXT)
         return
     
-    await message.answer(
-        f"📦 <b>Ваши заказы ({len(orders)}):</b>\n\n"
-        "Выберите заказ для просмотра деталей:",
-        reply_markup=get_orders_keyboard(orders)
+    text, keyboard = orders_page
+    await message.answer(text, reply_markup=keyboard)
+
+
+# --- Пагинация заказов ---
+@router.callback_query(F.data.startswith("orders_"))
+async def process_orders_page(callback: CallbackQuery, session: AsyncSession, client: Optional[ClientSnapshot]):
+    """Переход на соседнюю страницу заказов"""
+    _, page, direction, stamp, order_id = callback.data.split("_")
+    cursor = (datetime.strptime(stamp, ORDER_CURSOR_FORMAT), int(order_id))
+    
+    orders_page = await render_orders_page(
+        client.id, session, page=int(page), direction=direction, cursor=cursor
     )
+    if not orders_page:
+        await callback.answer("Больше заказов нет", show_alert=True)
+        return
+    
+    text, keyboard = orders_page
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
 
 
 # --- Просмотр деталей заказа ---
 @router.callback_query(F.data.startswith("order_"))
-async def show_order_details(callback: CallbackQuery):
+async def show_order_details(callback: CallbackQuery, session: AsyncSession):
     """Показать детали заказа"""
     order_id = int(callback.data.split("_")[1])
-    order = await database.get_order_by_id(order_id)
+    order = await database.get_order_detail(order_id, telegram_id=callback.from_user.id, session=session)
     
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
         return
     
-    # Получаем товары заказа
-    order_items = await database.get_order_items(order.id)
-    
-    # Формируем текст
-    text = (
-        f"📦 <b>Заказ #{order.tracking_number}</b>\n\n"
-        f"📅 Дата: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
-        f"📊 Статус: {order.status}\n"
-        f"🚚 Тип доставки: {order.delivery_type}\n\n"
-        "<b>Товары:</b>\n"
-    )
-    
-    for order_item, product in order_items:
-        text += f"• {product.name} x{order_item.quantity} - {format_price(order_item.price_rub * order_item.quantity)} ₽\n"
-    
-    text += (
-        f"\n💰 Стоимость товаров: {format_price(order.total_amount - order.delivery_cost - order.customs_fee)} ₽\n"
-        f"📦 Доставка: {format_price(order.delivery_cost)} ₽\n"
-        f"🛃 Таможенный сбор: {format_price(order.customs_fee)} ₽\n\n"
-        f"<b>💵 Итого: {format_price(order.total_amount)} ₽</b>"
-    )
-    
     # Проверяем, можно ли отменить заказ
     can_cancel = order.status == '📦 Обработка'
     
     await callback.message.edit_text(
-        text,
+        format_order_details(order),
         reply_markup=get_order_keyboard(order.id, can_cancel=can_cancel)
     )
     await callback.answer()
@@ -85,10 +124,10 @@ async def show_order_details(callback: CallbackQuery):
 
 # --- Отмена заказа ---
 @router.callback_query(F.data.startswith("cancel_order_"))
-async def cancel_order(callback: CallbackQuery):
+async def cancel_order(callback: CallbackQuery, session: AsyncSession):
     """Отмена заказа"""
     order_id = int(callback.data.split("_")[2])
-    order = await database.get_order_by_id(order_id)
+    order = await database.get_order_detail(order_id, telegram_id=callback.from_user.id, session=session)
     
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
@@ -101,56 +140,28 @@ async def cancel_order(callback: CallbackQuery):
         )
         return
     
-    await database.cancel_order(order.id)
+    # Статус загруженного заказа обновляется вместе с базой, перечитывать не нужно
+    await database.cancel_order(order.id, session=session)
     
     await callback.answer("✅ Заказ отменен", show_alert=True)
     
-    # Обновляем информацию о заказе
-    order = await database.get_order_by_id(order_id)
-    order_items = await database.get_order_items(order.id)
-    
-    text = (
-        f"📦 <b>Заказ #{order.tracking_number}</b>\n\n"
-        f"📅 Дата: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
-        f"📊 Статус: {order.status}\n"
-        f"🚚 Тип доставки: {order.delivery_type}\n\n"
-        "<b>Товары:</b>\n"
-    )
-    
-    for order_item, product in order_items:
-        text += f"• {product.name} x{order_item.quantity} - {format_price(order_item.price_rub * order_item.quantity)} ₽\n"
-    
-    text += (
-        f"\n💰 Стоимость товаров: {format_price(order.total_amount - order.delivery_cost - order.customs_fee)} ₽\n"
-        f"📦 Доставка: {format_price(order.delivery_cost)} ₽\n"
-        f"🛃 Таможенный сбор: {format_price(order.customs_fee)} ₽\n\n"
-        f"<b>💵 Итого: {format_price(order.total_amount)} ₽</b>"
-    )
-    
     await callback.message.edit_text(
-        text,
+        format_order_details(order),
         reply_markup=get_order_keyboard(order.id, can_cancel=False)
     )
 
 
 # --- Возврат к списку заказов ---
 @router.callback_query(F.data == "back_to_orders")
-async def back_to_orders(callback: CallbackQuery):
+async def back_to_orders(callback: CallbackQuery, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Возврат к списку заказов"""
-    client = await database.get_client_by_telegram_id(callback.from_user.id)
-    orders = await database.get_client_orders(client.id)
+    orders_page = await render_orders_page(client.id, session)
     
-    if not orders:
-        await callback.message.edit_text(
-            "📦 У вас пока нет заказов.\n\n"
-            "Перейдите в каталог товаров, чтобы сделать первый заказ!"
-        )
+    if not orders_page:
+        await callback.message.edit_text(NO_ORDERS_TEXT)
         await callback.answer()
         return
     
-    await callback.message.edit_text(
-        f"📦 <b>Ваши заказы ({len(orders)}):</b>\n\n"
-        "Выберите заказ для просмотра деталей:",
-        reply_markup=get_orders_keyboard(orders)
-    )
+    text, keyboard = orders_page
+    await callback.message.edit_text(text, reply_markup=keyboard)
     await callback.answer()
@@ -1,8 +1,12 @@
 # --- Импорты ---
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import database
+from cache import ClientSnapshot
 
 
 # --- Инициализация роутера ---
@@ -11,22 +15,15 @@ router = Router()
 
 # --- Просмотр профиля ---
 @router.message(F.text == "👤 Профиль")
-async def show_profile(message: Message):
+async def show_profile(message: Message, session: AsyncSession, client: Optional[ClientSnapshot]):
     """Показать профиль пользователя"""
-    client = await database.get_client_by_telegram_id(message.from_user.id)
     
     if not client:
         await message.answer("Пожалуйста, сначала зарегистрируйтесь через /start")
         return
     
-    # Получаем статистику заказов
-    orders = await database.get_client_orders(client.id)
-    total_orders = len(orders)
-    total_spent = sum(order.total_amount for order in orders)
-    
-    # Подсчитываем заказы по статусам
-    active_orders = len([o for o in orders if o.status not in ['✅ Получен', '❌ Отменен']])
-    completed_orders = len([o for o in orders if o.status == '✅ Получен'])
+    # Получаем статистику заказов (подсчет на стороне базы)
+    stats = await database.get_client_order_stats(client.id, session=session)
     
     text = (
         "👤 <b>Ваш профиль</b>\n\n"
@@ -35,10 +32,10 @@ async def show_profile(message: Message):
         f"📍 Адрес доставки: {client.address or 'Не указан'}\n"
         f"📅 Дата регистрации: {client.registration_date.strftime('%d.%m.%Y')}\n\n"
         "<b>📊 Статистика:</b>\n"
-        f"📦 Всего заказов: {total_orders}\n"
-        f"🔄 Активных заказов: {active_orders}\n"
-        f"✅ Завершенных заказов: {completed_orders}\n"
-        f"💰 Потрачено: {total_spent:,.2f} ₽\n\n"
+        f"📦 Всего заказов: {stats['total_orders']}\n"
+        f"🔄 Активных заказов: {stats['active_orders']}\n"
+        f"✅ Завершенных заказов: {stats['completed_orders']}\n"
+        f"💰 Потрачено: {stats['total_spent']:,.2f} ₽\n\n"
         "Для изменения данных профиля обратитесь к администратору."
     )
     
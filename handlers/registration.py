@@ -3,6 +3,7 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import database
 from config import ADMIN_IDS
@@ -26,12 +27,12 @@ router = Router()
 
 # --- Команда /start ---
 @router.message(CommandStart())
-async def start_command(message: Message, state: FSMContext):
+async def start_command(message: Message, state: FSMContext, session: AsyncSession):
     """Обработчик команды /start"""
     await state.clear()
     telegram_id = message.from_user.id
 
-    client = await database.get_client_by_telegram_id(telegram_id)
+    client = await database.get_client_by_telegram_id(telegram_id, session=session)
     is_admin = telegram_id in ADMIN_IDS
 
     if client:
@@ -200,7 +201,7 @@ async def ask_for_address(message: Message, state: FSMContext):
 
 
 @router.message(RegistrationStates.waiting_for_address_input)
-async def process_address_input(message: Message, state: FSMContext):
+async def process_address_input(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода адреса с использованием Dadata"""
     if message.text == "❌ Отменить регистрацию":
         await cancel_registration(message, state)
@@ -264,7 +265,7 @@ async def process_address_input(message: Message, state: FSMContext):
         return
 
     await state.update_data(address=address_query)
-    await complete_registration(message, state)
+    await complete_registration(message, state, session)
 
 
 @router.callback_query(RegistrationStates.waiting_for_address_selection, F.data.startswith("select_address_"))
@@ -321,7 +322,7 @@ async def process_manual_address_entry(callback: CallbackQuery, state: FSMContex
 
 
 @router.callback_query(RegistrationStates.waiting_for_address_confirmation, F.data == "confirm_address")
-async def process_address_confirmation(callback: CallbackQuery, state: FSMContext):
+async def process_address_confirmation(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Подтверждение выбранного адреса"""
     data = await state.get_data()
     formatted_address = data.get('formatted_address', '')
@@ -335,7 +336,7 @@ async def process_address_confirmation(callback: CallbackQuery, state: FSMContex
     await state.update_data(address=formatted_address)
 
     # ПРОСТО ВЫЗЫВАЕМ ФУНКЦИЮ ЗАВЕРШЕНИЯ РЕГИСТРАЦИИ
-    await complete_registration_callback(callback, state)
+    await complete_registration_callback(callback, state, session)
     await callback.answer()
 
 
@@ -350,7 +351,7 @@ async def process_new_address_entry(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-async def complete_registration_callback(callback: CallbackQuery, state: FSMContext):
+async def complete_registration_callback(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """Завершение регистрации из callback"""
     data = await state.get_data()
     name = data.get("name")
@@ -367,7 +368,8 @@ async def complete_registration_callback(callback: CallbackQuery, state: FSMCont
             telegram_id=telegram_id,
             name=name,
             phone=phone,
-            address=address
+            address=address,
+            session=session
         )
 
         is_admin = telegram_id in ADMIN_IDS
@@ -393,7 +395,7 @@ async def complete_registration_callback(callback: CallbackQuery, state: FSMCont
         await state.clear()
 
 
-async def complete_registration(message: Message, state: FSMContext):
+async def complete_registration(message: Message, state: FSMContext, session: AsyncSession):
     """Завершение регистрации из обычного сообщения"""
     data = await state.get_data()
     name = data.get("name")
@@ -409,7 +411,8 @@ async def complete_registration(message: Message, state: FSMContext):
             telegram_id=telegram_id,
             name=name,
             phone=phone,
-            address=address
+            address=address,
+            session=session
         )
 
         is_admin = telegram_id in ADMIN_IDS
@@ -446,11 +449,11 @@ async def cancel_registration(message: Message, state: FSMContext):
 
 # --- Главное меню (только для зарегистрированных пользователей) ---
 @router.message(F.text == "📋 Меню")
-async def show_menu(message: Message, state: FSMContext):
+async def show_menu(message: Message, state: FSMContext, session: AsyncSession):
     """Показать главное меню (только для зарегистрированных)"""
     telegram_id = message.from_user.id
 
-    client = await database.get_client_by_telegram_id(telegram_id)
+    client = await database.get_client_by_telegram_id(telegram_id, session=session)
 
     if not client:
         await message.answer(
@@ -491,9 +494,9 @@ async def about_bot(message: Message, state: FSMContext):
 
 # --- Обработчики для перезапуска ---
 @router.message(F.text == "🔄 Начать заново")
-async def restart_registration(message: Message, state: FSMContext):
+async def restart_registration(message: Message, state: FSMContext, session: AsyncSession):
     """Перезапуск регистрации"""
-    await start_command(message, state)
+    await start_command(message, state, session)
 
 
 @router.message(F.text == "❌ Выйти")
@@ -2,7 +2,7 @@
 import asyncio
 from database import (
     init_db, add_country, add_shop, add_category, add_product,
-    set_exchange_rate, add_admin
+    set_exchange_rates, add_admin
 )
 from config import ADMIN_IDS
 
@@ -17,10 +17,12 @@ async def initialize_database():
 
     # Добавляем курсы валют
     print("💱 Добавление курсов валют...")
-    await set_exchange_rate('USD', 95.0)
-    await set_exchange_rate('EUR', 105.0)
-    await set_exchange_rate('CNY', 13.0)
-    await set_exchange_rate('JPY', 0.65)
+    await set_exchange_rates({
+        'USD': 95.0,
+        'EUR': 105.0,
+        'CNY': 13.0,
+        'JPY': 0.65
+    })
     print("✅ Курсы валют установлены")
 
     # Добавляем страны
@@ -1,7 +1,7 @@
 # --- Импорты ---
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
-from typing import List
+from typing import List, Tuple
 
 
 # --- Основное меню ---
@@ -109,8 +109,19 @@ def get_categories_keyboard(shop_id: int) -> InlineKeyboardMarkup:
 
 
 # --- Инлайн-клавиатура для товаров ---
-def get_products_keyboard(products: List, page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
-    """Клавиатура списка товаров с пагинацией"""
+def get_products_keyboard(
+    products: List,
+    shop_id: int,
+    category_id: int,
+    page: int = 0,
+    has_prev: bool = False,
+    has_next: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка товаров с пагинацией.
+
+    Курсор страницы (крайний id товара) передается в callback_data:
+    page_{shop_id}_{category_id}_{номер страницы}_{p|n}_{id}.
+    """
     builder = InlineKeyboardBuilder()
 
     for product in products:
@@ -123,13 +134,19 @@ def get_products_keyboard(products: List, page: int = 0, total_pages: int = 1) -
 
     # Пагинация
     pagination_buttons = []
-    if page > 0:
+    if has_prev and products:
         pagination_buttons.append(
-            InlineKeyboardButton(text="⬅️ Назад", callback_data=f"page_{page - 1}")
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"page_{shop_id}_{category_id}_{max(page - 1, 0)}_p_{products[0].id}"
+            )
         )
-    if page < total_pages - 1:
+    if has_next and products:
         pagination_buttons.append(
-            InlineKeyboardButton(text="Вперед ➡️", callback_data=f"page_{page + 1}")
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"page_{shop_id}_{category_id}_{page + 1}_n_{products[-1].id}"
+            )
         )
     if pagination_buttons:
         builder.row(*pagination_buttons)
@@ -212,19 +229,32 @@ def get_delivery_keyboard() -> InlineKeyboardMarkup:
 
 
 # --- Инлайн-клавиатура для подтверждения заказа ---
-def get_order_confirmation_keyboard() -> InlineKeyboardMarkup:
+def get_order_confirmation_keyboard(delivery_type: str) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения заказа"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_order"),
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"confirm_order_{delivery_type}"),
         InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_checkout")
     )
     return builder.as_markup()
 
 
 # --- Инлайн-клавиатура для заказов ---
-def get_orders_keyboard(orders: List) -> InlineKeyboardMarkup:
-    """Клавиатура списка заказов"""
+# Дата заказа в курсоре пагинации (с микросекундами, чтобы курсор был точным)
+ORDER_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def get_orders_keyboard(
+    orders: List,
+    page: int = 0,
+    has_prev: bool = False,
+    has_next: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка заказов с пагинацией.
+
+    Курсор страницы (дата и id крайнего заказа) передается в callback_data:
+    orders_{номер страницы}_{p|n}_{дата}_{id}.
+    """
     builder = InlineKeyboardBuilder()
 
     for order in orders:
@@ -235,6 +265,27 @@ def get_orders_keyboard(orders: List) -> InlineKeyboardMarkup:
             )
         )
 
+    # Пагинация
+    pagination_buttons = []
+    if has_prev and orders:
+        first = orders[0]
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"orders_{max(page - 1, 0)}_p_{first.order_date.strftime(ORDER_CURSOR_FORMAT)}_{first.id}"
+            )
+        )
+    if has_next and orders:
+        last = orders[-1]
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"orders_{page + 1}_n_{last.order_date.strftime(ORDER_CURSOR_FORMAT)}_{last.id}"
+            )
+        )
+    if pagination_buttons:
+        builder.row(*pagination_buttons)
+
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu"))
     return builder.as_markup()
 
@@ -257,11 +308,20 @@ def get_order_keyboard(order_id: int, can_cancel: bool = False) -> InlineKeyboar
 
 
 # --- Инлайн-клавиатура для админ-заказов ---
-def get_admin_orders_keyboard(orders: List) -> InlineKeyboardMarkup:
-    """Клавиатура списка заказов для админа"""
+def get_admin_orders_keyboard(
+    orders: List,
+    page: int = 0,
+    has_prev: bool = False,
+    has_next: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка заказов для админа с пагинацией и фильтрами.
+
+    Курсор страницы передается в callback_data так же, как в get_orders_keyboard:
+    aorders_page_{номер страницы}_{p|n}_{дата}_{id}.
+    """
     builder = InlineKeyboardBuilder()
 
-    for order in orders[:10]:  # Показываем только первые 10
+    for order in orders:
         builder.row(
             InlineKeyboardButton(
                 text=f"📦 {order.tracking_number} - {order.status}",
@@ -269,10 +329,49 @@ def get_admin_orders_keyboard(orders: List) -> InlineKeyboardMarkup:
             )
         )
 
+    # Пагинация
+    pagination_buttons = []
+    if has_prev and orders:
+        first = orders[0]
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"aorders_page_{max(page - 1, 0)}_p_{first.order_date.strftime(ORDER_CURSOR_FORMAT)}_{first.id}"
+            )
+        )
+    if has_next and orders:
+        last = orders[-1]
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"aorders_page_{page + 1}_n_{last.order_date.strftime(ORDER_CURSOR_FORMAT)}_{last.id}"
+            )
+        )
+    if pagination_buttons:
+        builder.row(*pagination_buttons)
+
+    # Фильтры
+    builder.row(
+        InlineKeyboardButton(text="📊 Статус", callback_data="aorders_menu_status"),
+        InlineKeyboardButton(text="📅 Период", callback_data="aorders_menu_period"),
+        InlineKeyboardButton(text="🚚 Доставка", callback_data="aorders_menu_delivery")
+    )
+    builder.row(InlineKeyboardButton(text="♻️ Сбросить фильтры", callback_data="aorders_reset"))
+
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_admin"))
     return builder.as_markup()
 
 
+# --- Инлайн-клавиатура выбора фильтра заказов ---
+def get_admin_orders_filter_keyboard(kind: str, options: List[Tuple[str, str]]) -> InlineKeyboardMarkup:
+    """Варианты фильтра (значение, подпись); выбор приходит как aorders_set_{kind}_{значение}"""
+    builder = InlineKeyboardBuilder()
+    for value, label in options:
+        builder.row(InlineKeyboardButton(text=label, callback_data=f"aorders_set_{kind}_{value}"))
+    builder.row(InlineKeyboardButton(text="🔙 К заказам", callback_data="back_to_admin_orders"))
+    return builder.as_markup()
+
+
 # --- Инлайн-клавиатура для управления заказом админом ---
 def get_admin_order_keyboard(order_id: int) -> InlineKeyboardMarkup:
     """Клавиатура управления заказом для админа"""
@@ -329,6 +428,42 @@ def get_products_management_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+# --- Инлайн-клавиатура списка товаров для админа ---
+def get_admin_products_keyboard(
+    products: List,
+    page: int = 0,
+    has_prev: bool = False,
+    has_next: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура списка товаров для админа с пагинацией.
+
+    Курсор страницы (крайний id товара) передается в callback_data:
+    aproducts_{номер страницы}_{p|n}_{id}.
+    """
+    builder = InlineKeyboardBuilder()
+
+    pagination_buttons = []
+    if has_prev and products:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"aproducts_{max(page - 1, 0)}_p_{products[0].id}"
+            )
+        )
+    if has_next and products:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"aproducts_{page + 1}_n_{products[-1].id}"
+            )
+        )
+    if pagination_buttons:
+        builder.row(*pagination_buttons)
+
+    builder.attach(InlineKeyboardBuilder.from_markup(get_products_management_keyboard()))
+    return builder.as_markup()
+
+
 # --- Инлайн-клавиатура для отмены операций ---
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для отмены операций"""
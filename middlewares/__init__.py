@@ -0,0 +1,3 @@
+# --- Импорт middleware ---
+from .db_session import DbSessionMiddleware
+from .client import ClientMiddleware
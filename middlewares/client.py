@@ -0,0 +1,29 @@
+# --- Импорты ---
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import database
+
+
+# --- Клиент, отправивший апдейт ---
+class ClientMiddleware(BaseMiddleware):
+    """Передает в хендлеры снимок зарегистрированного клиента как `client` (или None).
+
+    Клиент берется из кэша database.client_cache, поэтому обычно апдейт не
+    делает запроса к БД; при промахе он читается в сессии апдейта, без
+    отдельного соединения. Регистрируется после DbSessionMiddleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["client"] = None
+        if user is not None and not user.is_bot:
+            data["client"] = await database.get_client_by_telegram_id(user.id, session=data.get("session"))
+        return await handler(event, data)
@@ -0,0 +1,34 @@
+# --- Импорты ---
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+# --- Сессия базы данных на один апдейт ---
+class DbSessionMiddleware(BaseMiddleware):
+    """Открывает одну сессию на апдейт и передает её в хендлеры как `session`.
+
+    Соединение берется из пула только при первом запросе, а все изменения
+    хендлера фиксируются одним коммитом после его завершения.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        super().__init__()
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            result = await handler(event, data)
+
+            # Неудачная транзакция (например, IntegrityError) откатится при закрытии сессии
+            if session.in_transaction() and session.is_active:
+                await session.commit()
+            return result
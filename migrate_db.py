@@ -0,0 +1,88 @@
+# --- Скрипт для обновления уже существующей базы данных ---
+# init_db() создает колонки и индексы только вместе с новыми таблицами, поэтому
+# базу, созданную до их появления в models.py, нужно один раз мигрировать.
+import asyncio
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from database import engine, close_db
+from models import Base
+
+
+# --- Объединение дублей в корзине перед уникальным индексом ---
+MERGE_CART_DUPLICATES = [
+    """
+    UPDATE cart_items
+    SET quantity = (
+        SELECT SUM(dup.quantity) FROM cart_items AS dup
+        WHERE dup.client_id = cart_items.client_id AND dup.product_id = cart_items.product_id
+    )
+    WHERE id IN (
+        SELECT MIN(id) FROM cart_items
+        GROUP BY client_id, product_id
+        HAVING COUNT(*) > 1
+    )
+    """,
+    """
+    DELETE FROM cart_items
+    WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY client_id, product_id)
+    """
+]
+
+
+def find_missing_columns(sync_conn) -> list:
+    """Колонки из models.py, которых нет в существующих таблицах"""
+    inspector = inspect(sync_conn)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+
+def build_add_column(column, dialect) -> str:
+    """ALTER TABLE ... ADD COLUMN; новые колонки добавляются допускающими NULL"""
+    return (
+        f"ALTER TABLE {column.table.name} "
+        f"ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+    )
+
+
+def build_create_index(index, dialect) -> str:
+    """CREATE INDEX IF NOT EXISTS; в PostgreSQL - без блокировки записи (CONCURRENTLY)"""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    if dialect.name == 'postgresql':
+        ddl = re.sub(r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', ddl)
+    return ddl
+
+
+async def migrate_db():
+    """Создание недостающих колонок и индексов из models.py"""
+    print("🔄 Миграция базы данных...")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for column in await conn.run_sync(find_missing_columns):
+            await conn.execute(text(build_add_column(column, engine.dialect)))
+            print(f"✅ {column.table.name}: колонка {column.name}")
+
+        for statement in MERGE_CART_DUPLICATES:
+            await conn.execute(text(statement))
+    print("✅ Дубли в корзинах объединены")
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in Base.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                await conn.execute(text(build_create_index(index, engine.dialect)))
+                print(f"✅ {table.name}: {index.name}")
+
+    await close_db()
+    print("\n🎉 Миграция завершена успешно!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_db())
@@ -1,6 +1,6 @@
 # --- Импорты ---
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Float, Text, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -55,7 +55,7 @@ class Shop(Base):
     __tablename__ = 'shops'
 
     id = Column(Integer, primary_key=True)
-    country_id = Column(Integer, ForeignKey('countries.id', ondelete='CASCADE'), nullable=False)
+    country_id = Column(Integer, ForeignKey('countries.id', ondelete='CASCADE'), nullable=False, index=True)
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     website = Column(String, nullable=True)
@@ -95,7 +95,7 @@ class Product(Base):
 
     id = Column(Integer, primary_key=True)
     shop_id = Column(Integer, ForeignKey('shops.id', ondelete='CASCADE'), nullable=False)
-    category_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'), nullable=False)
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'), nullable=False, index=True)
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     price_original = Column(Float, nullable=False)  # Цена в оригинальной валюте
@@ -104,6 +104,11 @@ class Product(Base):
     photo_url = Column(String, nullable=True)  # URL фото
     photo_file_id = Column(String, nullable=True)  # Telegram file_id
 
+    __table_args__ = (
+        # Каталог: товары магазина в категории, постранично по id
+        Index('ix_products_shop_id_category_id_id', shop_id, category_id, id),
+    )
+
     shop = relationship('Shop', back_populates='products')
     category = relationship('Category', back_populates='products')
     order_items = relationship(
@@ -125,10 +130,16 @@ class Order(Base):
     total_amount = Column(Float, nullable=False)  # Общая сумма в рублях
     delivery_cost = Column(Float, nullable=False)  # Стоимость доставки
     customs_fee = Column(Float, nullable=False)  # Таможенный сбор
-    status = Column(String, default='📦 Обработка')  # Статус заказа
-    order_date = Column(DateTime, default=datetime.now)
+    status = Column(String, default='📦 Обработка', index=True)  # Статус заказа
+    order_date = Column(DateTime, default=datetime.now, index=True)
     tracking_number = Column(String, unique=True, nullable=False)  # Номер отслеживания
     delivery_type = Column(String, nullable=False)  # эконом, стандарт, экспресс
+    idempotency_key = Column(String, unique=True, index=True, nullable=True)  # Защита от повторного оформления
+
+    __table_args__ = (
+        # История заказов клиента: новые сверху
+        Index('ix_orders_client_id_order_date', client_id, order_date.desc()),
+    )
 
     client = relationship('Client', back_populates='orders')
     order_items = relationship(
@@ -149,7 +160,7 @@ class OrderItem(Base):
     __tablename__ = 'order_items'
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
     quantity = Column(Integer, nullable=False)
     price_rub = Column(Float, nullable=False)  # Цена в рублях на момент заказа
@@ -195,5 +206,78 @@ class CartItem(Base):
     product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
 
+    __table_args__ = (
+        # Одна строка на товар в корзине клиента; покрывает и выборку по client_id
+        Index('uq_cart_items_client_id_product_id', client_id, product_id, unique=True),
+    )
+
     def __repr__(self):
         return f"<CartItem(id={self.id}, client_id={self.client_id}, product_id={self.product_id})>"
+
+
+# --- Модель состояния FSM (хранилище FSM_STORAGE=database) ---
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+
+    key = Column(String, primary_key=True)  # bot_id:chat_id:user_id:thread_id:destiny
+    state = Column(String, nullable=True)
+    data = Column(JSON, nullable=False, default=dict)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<FsmState(key='{self.key}', state='{self.state}')>"
+
+
+# --- Модель задания рассылки ---
+class BroadcastJob(Base):
+    __tablename__ = 'broadcast_jobs'
+
+    id = Column(Integer, primary_key=True)
+    message_type = Column(String, nullable=False)  # text, photo, document
+    content = Column(Text, nullable=True)  # Текст сообщения
+    caption = Column(Text, nullable=True)  # Подпись к фото или документу
+    file_id = Column(String, nullable=True)
+    file_name = Column(String, nullable=True)
+    status = Column(String, nullable=False, default='pending', index=True)  # pending, running, finished
+    total = Column(Integer, nullable=False, default=0)  # Получателей на момент создания
+    sent = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)  # Заблокировали бота
+    failed = Column(Integer, nullable=False, default=0)
+    last_client_id = Column(Integer, nullable=False, default=0)  # Контрольная точка: обработаны все клиенты до этого id
+    admin_chat_id = Column(BigInteger, nullable=False)  # Куда выводить прогресс
+    progress_message_id = Column(Integer, nullable=True)
+    idempotency_key = Column(String, unique=True, index=True, nullable=True)  # Сообщение с предпросмотром: chat_id:message_id
+    worker_id = Column(String, nullable=True)  # Процесс, выполняющий рассылку
+    heartbeat_at = Column(DateTime, nullable=True)  # Последняя контрольная точка воркера
+    created_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+    deliveries = relationship(
+        'BroadcastDelivery',
+        back_populates='job',
+        cascade='all, delete-orphan'
+    )
+
+    def __repr__(self):
+        return f"<BroadcastJob(id={self.id}, status='{self.status}', sent={self.sent}/{self.total})>"
+
+
+# --- Модель доставки рассылки получателю ---
+class BroadcastDelivery(Base):
+    __tablename__ = 'broadcast_deliveries'
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), nullable=False)
+    client_id = Column(Integer, ForeignKey('clients.id', ondelete='CASCADE'), nullable=False)
+    status = Column(String, nullable=False)  # sent, blocked, failed
+    processed_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # Каждый клиент получает рассылку не больше одного раза
+        Index('uq_broadcast_deliveries_job_id_client_id', job_id, client_id, unique=True),
+    )
+
+    job = relationship('BroadcastJob', back_populates='deliveries')
+
+    def __repr__(self):
+        return f"<BroadcastDelivery(job_id={self.job_id}, client_id={self.client_id}, status='{self.status}')>"
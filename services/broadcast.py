@@ -0,0 +1,270 @@
+# services/broadcast.py
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import suppress
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter
+
+import database
+from config import (
+    BROADCAST_RATE,
+    BROADCAST_CHAT_INTERVAL,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_PROGRESS_INTERVAL,
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_JOB_LEASE,
+    BROADCAST_POLL_INTERVAL
+)
+from models import BroadcastJob
+from utils import format_broadcast_progress
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять отправку одному получателю после RetryAfter
+MAX_RETRIES = 3
+
+
+# --- Ограничение частоты запросов ---
+class TokenBucket:
+    """Token bucket: не более rate запросов в секунду с запасом capacity.
+
+    По умолчанию запас в один токен: после простоя запросы идут равномерно,
+    а не пачкой в rate штук, которая сама по себе может вызвать RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (Telegram ответил RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Дождаться свободного токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Общий лимит бота и минимальный интервал между сообщениями в один чат"""
+
+    def __init__(self, rate: float, chat_interval: float):
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self._chat_next: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+
+        next_at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, next_at) + self.chat_interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+        await self.bucket.acquire()
+
+
+# --- Рассылка ---
+class BroadcastService:
+    """Воркер рассылок: берет задания из broadcast_jobs и отправляет их пачками.
+
+    После каждой пачки результаты и контрольная точка сохраняются в базе, поэтому
+    после перезапуска рассылка продолжается с места остановки. При штатной остановке
+    сохраняется и часть пачки; после аварийного завершения повторно может быть
+    отправлена только последняя несохраненная пачка.
+    """
+
+    def __init__(self):
+        self.limiter = RateLimiter(BROADCAST_RATE, BROADCAST_CHAT_INTERVAL)
+        self.worker_id = uuid.uuid4().hex
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def deliver(self, bot: Bot, chat_id: int, job: BroadcastJob):
+        """Отправить одно сообщение рассылки с учетом лимитов"""
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire(chat_id)
+            try:
+                if job.message_type == 'text':
+                    await bot.send_message(chat_id=chat_id, text=job.content)
+                elif job.message_type == 'photo':
+                    await bot.send_photo(chat_id=chat_id, photo=job.file_id, caption=job.caption)
+                elif job.message_type == 'document':
+                    await bot.send_document(chat_id=chat_id, document=job.file_id, caption=job.caption)
+                else:
+                    raise ValueError(f"Неподдерживаемый тип сообщения рассылки: {job.message_type}")
+                return
+            except TelegramRetryAfter as e:
+                # Ограничение действует на весь бот, поэтому останавливаем всех отправителей
+                logger.warning(f"Рассылка: RetryAfter {e.retry_after} с")
+                self.limiter.bucket.pause(e.retry_after)
+                if attempt == MAX_RETRIES:
+                    raise
+
+    async def _deliver_status(self, bot: Bot, semaphore: asyncio.Semaphore, chat_id: int, job: BroadcastJob) -> str:
+        async with semaphore:
+            try:
+                await self.deliver(bot, chat_id, job)
+                return 'sent'
+            except (TelegramForbiddenError, TelegramNotFound):
+                # Пользователь заблокировал бота или удалил аккаунт
+                return 'blocked'
+            except Exception as e:
+                logger.warning(f"Рассылка: ошибка отправки {chat_id}: {e}")
+                return 'failed'
+
+    async def report(self, bot: Bot, job: BroadcastJob):
+        """Обновить сообщение с прогрессом у администратора"""
+        if not job.progress_message_id:
+            return
+        try:
+            await self.limiter.acquire(job.admin_chat_id)
+            await bot.edit_message_text(
+                format_broadcast_progress(job),
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id
+            )
+        except Exception as e:
+            logger.warning(f"Рассылка: не удалось обновить прогресс: {e}")
+
+    async def heartbeat(self, job_id: int):
+        """Продлевать аренду задания, пока идет отправка.
+
+        Пачка с паузами RetryAfter может отправляться дольше BROADCAST_JOB_LEASE,
+        и без отметок другой воркер счел бы задание брошенным и начал его заново.
+        """
+        while True:
+            await asyncio.sleep(BROADCAST_JOB_LEASE / 3)
+            try:
+                if not await database.renew_broadcast_lease(job_id, self.worker_id):
+                    logger.warning(f"Рассылка #{job_id}: аренда задания потеряна")
+                    return
+            except Exception as e:
+                logger.warning(f"Рассылка #{job_id}: не удалось продлить аренду: {e}")
+
+    async def process_job(self, bot: Bot, job: BroadcastJob):
+        """Выполнить захваченное задание, начиная с его контрольной точки"""
+        heartbeat = asyncio.create_task(self.heartbeat(job.id))
+        try:
+            await self._process_job(bot, job)
+        finally:
+            heartbeat.cancel()
+            with suppress(asyncio.CancelledError):
+                await heartbeat
+
+    async def _process_job(self, bot: Bot, job: BroadcastJob):
+        logger.info(f"Рассылка #{job.id}: старт с клиента id>{job.last_client_id}")
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        last_report = 0.0
+
+        deliveries = []
+
+        async def send(client_id: int, telegram_id: int):
+            status = await self._deliver_status(bot, semaphore, telegram_id, job)
+            deliveries.append((client_id, status))
+
+        try:
+            while True:
+                recipients = await database.get_broadcast_recipients(
+                    job.id, job.last_client_id, BROADCAST_BATCH_SIZE
+                )
+                if not recipients:
+                    break
+
+                deliveries = []
+                await asyncio.gather(*(send(client_id, telegram_id) for client_id, telegram_id in recipients))
+
+                saved = await database.save_broadcast_checkpoint(
+                    job.id, self.worker_id, deliveries, last_client_id=recipients[-1][0]
+                )
+                if not saved:
+                    logger.warning(f"Рассылка #{job.id}: задание перехвачено другим воркером")
+                    return
+
+                job.last_client_id = recipients[-1][0]
+                for _, status in deliveries:
+                    setattr(job, status, getattr(job, status) + 1)
+                deliveries = []
+
+                if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self.report(bot, job)
+
+        except asyncio.CancelledError:
+            # Уже доставленные сообщения прерванной пачки сохраняются без сдвига
+            # контрольной точки, чтобы после перезапуска их не отправить повторно
+            with suppress(Exception):
+                await database.save_broadcast_checkpoint(
+                    job.id, self.worker_id, deliveries, last_client_id=job.last_client_id
+                )
+                await database.release_broadcast_job(job.id, self.worker_id)
+            logger.info(f"Рассылка #{job.id}: остановлена на клиенте id={job.last_client_id}")
+            raise
+
+        job = await database.finish_broadcast_job(job.id, self.worker_id)
+        logger.info(
+            f"Рассылка #{job.id}: завершена, отправлено {job.sent}, "
+            f"заблокировали {job.blocked}, ошибок {job.failed}"
+        )
+        await self.report(bot, job)
+
+    async def _run_worker(self, bot: Bot):
+        while True:
+            try:
+                self._wakeup.clear()
+                job = await database.claim_broadcast_job(self.worker_id, BROADCAST_JOB_LEASE)
+                if job is not None:
+                    await self.process_job(bot, job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Рассылка: ошибка воркера: {e}")
+
+            # Новых заданий нет: ждем пробуждения или периодически проверяем брошенные задания
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), BROADCAST_POLL_INTERVAL)
+
+    def wake(self):
+        """Сообщить воркеру о новом задании"""
+        self._wakeup.set()
+
+    async def start(self, bot: Bot):
+        """Запустить воркер (при старте бота); подхватывает и незавершенные рассылки"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run_worker(bot))
+
+    async def stop(self):
+        """Остановить воркер (при завершении работы бота), задание возвращается в очередь"""
+        if self._worker is not None:
+            self._worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+
+
+# Глобальный экземпляр
+broadcast_service = BroadcastService()
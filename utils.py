@@ -1,8 +1,10 @@
 # --- Импорты ---
 import logging
 import re
+from datetime import datetime
+from typing import List, Optional, Tuple, TypedDict
 from aiogram.fsm.state import State, StatesGroup
-from config import LOG_LEVEL
+from config import LOG_LEVEL, DELIVERY_TYPES, CUSTOMS_FEE_PERCENT
 
 
 # --- Настройка логирования ---
@@ -45,6 +47,31 @@ class CartStates(StatesGroup):
     confirming_order = State()
 
 
+# --- Данные FSM: Оформление заказа ---
+# В состоянии хранятся только примитивы (без ORM-объектов), чтобы данные
+# были компактными и переживали сериализацию во внешнее хранилище.
+class CheckoutItem(TypedDict):
+    product_id: int
+    name: str
+    quantity: int
+    price_original: float
+    currency: str
+
+
+def snapshot_cart_items(cart_items: list) -> List[CheckoutItem]:
+    """Снимок корзины из кортежей (CartItem, Product) для хранения в FSM"""
+    return [
+        CheckoutItem(
+            product_id=product.id,
+            name=product.name,
+            quantity=cart_item.quantity,
+            price_original=product.price_original,
+            currency=product.currency
+        )
+        for cart_item, product in cart_items
+    ]
+
+
 # --- Состояния FSM: Админ ---
 class AdminStates(StatesGroup):
     # Управление товарами
@@ -159,11 +186,132 @@ async def convert_to_rub(amount: float, currency: str, exchange_rates: dict) ->
     return amount * rate
 
 
+# --- Расчет стоимости заказа ---
+async def calculate_order_totals(items: List[CheckoutItem], exchange_rates: dict, delivery_type: str) -> dict:
+    """Стоимость товаров, доставки, таможенный сбор и итог в рублях"""
+    subtotal = 0.0
+    for item in items:
+        price_rub = await convert_to_rub(item['price_original'], item['currency'], exchange_rates)
+        subtotal += price_rub * item['quantity']
+
+    # Базовая доставка (средняя по странам)
+    base_delivery = 1000.0
+    delivery_cost = base_delivery * DELIVERY_TYPES[delivery_type]['multiplier']
+
+    # Таможенный сбор
+    customs_fee = subtotal * CUSTOMS_FEE_PERCENT
+
+    return {
+        'subtotal': subtotal,
+        'delivery_cost': delivery_cost,
+        'customs_fee': customs_fee,
+        'total': subtotal + delivery_cost + customs_fee
+    }
+
+
 def format_price(price: float) -> str:
     """Форматирование цены"""
     return f"{price:,.2f}".replace(',', ' ')
 
 
+# --- Карточка заказа ---
+def format_order_details(order, with_client: bool = False) -> str:
+    """Текст карточки заказа, загруженного через database.get_order_detail"""
+    text = f"📦 <b>Заказ #{order.tracking_number}</b>\n\n"
+    if with_client:
+        client = order.client
+        text += (
+            f"👤 Клиент: {client.name}\n"
+            f"📱 Телефон: {client.phone}\n"
+            f"🆔 Telegram: <a href='tg://user?id={client.telegram_id}'>@{client.telegram_id}</a>\n"
+            f"📍 Адрес: {client.address}\n\n"
+            f"📅 Дата заказа: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
+        )
+    else:
+        text += f"📅 Дата: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
+
+    text += (
+        f"📊 Статус: {order.status}\n"
+        f"🚚 Тип доставки: {order.delivery_type}\n\n"
+        "<b>Товары:</b>\n"
+    )
+
+    for order_item in order.order_items:
+        text += f"• {order_item.product.name} x{order_item.quantity} - {format_price(order_item.price_rub * order_item.quantity)} ₽\n"
+
+    text += (
+        f"\n💰 Стоимость товаров: {format_price(order.total_amount - order.delivery_cost - order.customs_fee)} ₽\n"
+        f"📦 Доставка: {format_price(order.delivery_cost)} ₽\n"
+        f"🛃 Таможенный сбор: {format_price(order.customs_fee)} ₽\n\n"
+        f"<b>💵 Итого: {format_price(order.total_amount)} ₽</b>"
+    )
+    return text
+
+
+# --- Пагинация ---
+def page_flags(direction: Optional[str], has_more: bool) -> Tuple[bool, bool]:
+    """Есть ли предыдущая и следующая страницы (has_prev, has_next).
+
+    direction - направление листания ('n' вперед, 'p' назад, None - первая
+    страница), has_more - результат database.get_keyset_page. В сторону,
+    откуда пришли, страницы есть всегда; в сторону листания - если has_more.
+    """
+    if direction == 'p':
+        return has_more, True
+    return direction == 'n', has_more
+
+
+# --- Тексты с ограничением длины ---
+# Максимальная длина текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+def fit_message(header: str, entries: List[str], footer: str = "", limit: int = MAX_MESSAGE_LENGTH) -> Tuple[str, int]:
+    """Собрать сообщение из заголовка и записей, не превышая limit символов.
+
+    Записи добавляются по порядку, пока текст помещается. Возвращает текст и
+    количество вошедших записей (хотя бы одна, если записи есть). Длина
+    считается вместе с HTML-разметкой, то есть с запасом.
+    """
+    text = header
+    budget = limit - len(header) - len(footer)
+    count = 0
+    for entry in entries:
+        if len(entry) > budget and count:
+            break
+        text += entry
+        budget -= len(entry)
+        count += 1
+    return text + footer, count
+
+
+# --- Прогресс рассылки ---
+def format_broadcast_progress(job) -> str:
+    """Текст сообщения о ходе рассылки по заданию BroadcastJob"""
+    processed = job.sent + job.blocked + job.failed
+    total = max(job.total, processed, 1)
+
+    if job.status == 'finished':
+        title = "📢 <b>Рассылка завершена!</b>"
+    else:
+        title = "📢 <b>Рассылка в процессе</b>"
+
+    text = (
+        f"{title}\n\n"
+        f"👥 Всего пользователей: {job.total}\n"
+        f"✅ Отправлено: {job.sent}/{job.total}\n"
+        f"🚫 Заблокировали бота: {job.blocked}\n"
+        f"❌ Ошибок: {job.failed}\n"
+    )
+    if job.status == 'finished':
+        text += f"📊 Эффективность: {job.sent / total * 100:.1f}%\n"
+    else:
+        text += f"\n⏳ Прогресс: {processed / total * 100:.1f}%\n"
+    if job.created_at:
+        text += f"⏱️ Время: {int((datetime.now() - job.created_at).total_seconds())} с"
+    return text
+
+
 # --- Статусы заказов ---
 ORDER_STATUSES = [
     '📦 Обработка',